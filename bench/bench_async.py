@@ -0,0 +1,99 @@
+"""Event loop latency while serving concurrent fit evaluations, calling
+Context inline on the loop against AsyncContext (Python 3.5+).
+
+A ticker coroutine sleeps 1ms at a time and records how late it wakes up
+while one client per context sends requests, each evaluating a fit and
+reading its capacitor and ship affectors.
+"""
+import asyncio
+import sys
+import time
+
+import dogma
+import dogma_async
+
+from bench.bench_fit_diff import make_fits
+
+TICK = 0.001
+
+
+async def ticker(lags, done):
+    while not done:
+        start = time.time()
+        await asyncio.sleep(TICK)
+        lags.append(time.time() - start - TICK)
+
+
+def request(context, fit, attributes):
+    if not context.has_baseline():
+        context.set_baseline()
+    context.reset()
+    result = context.evaluate_fit(fit, attributes)
+    context.get_capacitor_all(False)
+    context.get_affectors(dogma.Location.ship())
+    return result
+
+
+async def inline(contexts, fit, attributes, requests):
+    for i in range(requests):
+        request(contexts[i % len(contexts)], fit, attributes)
+        await asyncio.sleep(0)
+
+
+async def threaded(contexts, fit, attributes, requests):
+    async def client(context, count):
+        for i in range(count):
+            await context.run(
+                lambda context: request(context, fit, attributes))
+    await asyncio.gather(*[client(context, requests // len(contexts))
+                           for context in contexts])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+async def measure(name, serve):
+    lags = []
+    done = []
+    tick = asyncio.ensure_future(ticker(lags, done))
+    await asyncio.sleep(0.05)
+    del lags[:]
+    start = time.time()
+    await serve()
+    elapsed = time.time() - start
+    done.append(True)
+    await tick
+    lags = lags or [0.0]
+    print("  %-12s %8.0f requests/s   loop lag p50 %6.2f ms  p99 %6.2f ms"
+          "  max %6.2f ms" % (name, serve.requests / elapsed,
+                              percentile(lags, 50) * 1e3,
+                              percentile(lags, 99) * 1e3, max(lags) * 1e3))
+
+
+def main(requests=5000, concurrency=32):
+    fit = make_fits()[0]
+    attributes = [(dogma.Location.ship(), 37), (('module', 0), 6)]
+    contexts = [dogma.Context() for i in range(concurrency)]
+    wrappers = [dogma_async.AsyncContext(context) for context in contexts]
+
+    def serve_inline():
+        return inline(contexts, fit, attributes, requests)
+
+    def serve_threaded():
+        return threaded(wrappers, fit, attributes, requests)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        for name, serve in [("inline", serve_inline),
+                            ("AsyncContext", serve_threaded)]:
+            serve.requests = requests
+            loop.run_until_complete(measure(name, serve))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
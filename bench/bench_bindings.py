@@ -0,0 +1,71 @@
+"""Calls per second through the Context bindings.
+
+Each binding is timed through the prototyped fast path and through an
+emulation of the old per-call path (accept_or_cast on every argument,
+then an unprototyped call), so both figures come from the same run.
+"""
+from ctypes import byref, c_double
+
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+
+def legacy(name, types):
+    function = dogma.bare_function(name)
+
+    def call(*values):
+        casted = [dogma.accept_or_cast(typ, val)
+                  for typ, val in zip(types, values)]
+        return dogma.chk(function(*casted))
+    return call
+
+
+def main():
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    slot = ctx.add_module(TYPE_SmallAncillaryShieldBooster)
+    states = [dogma.State.ONLINE, dogma.State.ACTIVE]
+
+    def get_ship_attribute():
+        ctx.get_ship_attribute(ATT_MaxLockedTargets)
+
+    def add_module():
+        ctx.remove_module(ctx.add_module(TYPE_StasisWebifierI))
+
+    def set_module_state():
+        for state in states:
+            ctx.set_module_state(slot, state)
+
+    legacy_get = legacy('dogma_get_ship_attribute',
+                        (dogma._, dogma.attributeid_t, dogma._))
+    legacy_add = legacy('dogma_add_module', (dogma._, dogma.typeid_t, dogma._))
+    legacy_remove = legacy('dogma_remove_module', (dogma._, dogma.key_t))
+    legacy_state = legacy('dogma_set_module_state',
+                          (dogma._, dogma.key_t, dogma.state_t))
+
+    def legacy_get_ship_attribute():
+        result = c_double()
+        legacy_get(ctx, ATT_MaxLockedTargets, byref(result))
+
+    def legacy_add_module():
+        new_slot = dogma.key_t()
+        legacy_add(ctx, TYPE_StasisWebifierI, byref(new_slot))
+        legacy_remove(ctx, new_slot.value)
+
+    def legacy_set_module_state():
+        for state in states:
+            legacy_state(ctx, slot, state)
+
+    for name, fast, slow, calls in [
+            ("get_ship_attribute", get_ship_attribute,
+             legacy_get_ship_attribute, 1),
+            ("add_module + remove_module", add_module, legacy_add_module, 2),
+            ("set_module_state", set_module_state, legacy_set_module_state, 2)]:
+        print("  %-30s %10.0f calls/s (was %10.0f calls/s)" % (
+            name, calls / per_call(fast, 20000), calls / per_call(slow, 20000)))
+
+
+if __name__ == '__main__':
+    main()
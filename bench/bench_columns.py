@@ -0,0 +1,48 @@
+"""Writing evaluated rows to a column store against pickling a dict of
+attribute values per fit."""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import dogma
+import dogma_columns
+
+NAMES = ['attribute%d' % i for i in range(16)]
+
+
+def main(rows=200000):
+    columns = [(name, dogma.Location.ship(), i)
+               for i, name in enumerate(NAMES)]
+    values = [float(i) for i in range(len(NAMES))]
+    path = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        with dogma_columns.ColumnWriter(os.path.join(path, 'store'),
+                                        columns) as writer:
+            for fit_id in range(rows):
+                writer.append(fit_id, values)
+        columns_time = time.time() - start
+
+        start = time.time()
+        with open(os.path.join(path, 'rows.pickle'), 'wb') as f:
+            for fit_id in range(rows):
+                pickle.dump((fit_id, dict(zip(NAMES, values))), f, 2)
+        pickle_time = time.time() - start
+
+        store_size = sum(os.path.getsize(os.path.join(path, 'store', name))
+                         for name in os.listdir(os.path.join(path, 'store')))
+        pickle_size = os.path.getsize(os.path.join(path, 'rows.pickle'))
+        for name, elapsed, size in [("ColumnWriter", columns_time, store_size),
+                                    ("pickle per row", pickle_time,
+                                     pickle_size)]:
+            print("  %-30s %10.0f rows/s %8.1f MB"
+                  % (name, rows / elapsed, size / 1e6))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
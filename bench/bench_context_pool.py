@@ -0,0 +1,35 @@
+"""Fits evaluated per second with fresh contexts and with a ContextPool."""
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+
+def evaluate(ctx):
+    ctx.set_ship(TYPE_Rifter)
+    for i in range(3):
+        ctx.add_module(TYPE_125mmGatlingAutoCannonII,
+                       state=dogma.State.ACTIVE, charge=TYPE_BarrageS)
+    ctx.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE)
+    ctx.add_drone(TYPE_WarriorI, 2)
+    ctx.add_implant(TYPE_SnakeOmega)
+    ctx.set_skill_level(TYPE_Drones, 4)
+    return ctx.get_ship_attribute(ATT_MaxVelocity)
+
+
+def main():
+    pool = dogma.ContextPool()
+
+    def fresh():
+        evaluate(dogma.Context())
+
+    def pooled():
+        with pool.context() as ctx:
+            evaluate(ctx)
+
+    for name, fn in [("Context()", fresh), ("ContextPool", pooled)]:
+        print("  %-40s %12.0f fits/s" % (name, 1 / per_call(fn, 2000)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Effect attributes of every module, charge and drone of a fit: effect
+discovery by get_nth_type_effect_with_attributes until NotFoundException
+and get_location_effect_attributes per effect, against
+get_all_effect_attributes."""
+import sys
+from ctypes import byref
+
+import dogma
+
+from bench.common import per_call
+from bench.bench_fit_diff import make_fits
+
+
+def _nth_effect(typeid, n):
+    # unmemoized, as a caller without type_effects_with_attributes would
+    result = dogma.effectid_t()
+    dogma.chk(dogma.libdogma.dogma_get_nth_type_effect_with_attributes(
+        typeid, n, byref(result)))
+    return result.value
+
+
+def naive(ctx):
+    rows = []
+    locations = []
+    for slot, (module, state, charge) in sorted(ctx._modules.items()):
+        locations.append((dogma.Location.module(slot), module))
+        if charge is not None:
+            locations.append((dogma.Location.charge(slot), charge))
+    for drone in sorted(ctx._drones):
+        locations.append((dogma.Location.drone(drone), drone))
+    for location, typeid in locations:
+        n = 0
+        while True:
+            try:
+                effect = _nth_effect(typeid, n)
+            except dogma.NotFoundException:
+                break
+            rows.append((location, effect) +
+                        ctx.get_location_effect_attributes(location, effect))
+            n += 1
+    return rows
+
+
+def main(rounds=200):
+    ctx = dogma.Context()
+    ctx.load_fit(make_fits()[0])
+    for name, fn in [
+            ("get_nth + get_location_effect_attributes", lambda: naive(ctx)),
+            ("get_all_effect_attributes", ctx.get_all_effect_attributes)]:
+        print("  %-40s %12.3f ms" % (name, per_call(fn, rounds) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,45 @@
+"""Swapping one module out of an 8-module fit: apply_fit_diff against
+resetting the context and loading the whole fit again."""
+import sys
+
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+ACTIVE = dogma.State.ACTIVE
+
+
+def make_fits():
+    modules = [(TYPE_125mmGatlingAutoCannonII, ACTIVE, TYPE_BarrageS)] * 3
+    modules += [(TYPE_StasisWebifierI, ACTIVE, None)]
+    modules += [(TYPE_SmallAncillaryShieldBooster, ACTIVE, TYPE_CapBooster25)] * 4
+    swapped = list(modules)
+    swapped[3] = (TYPE_SmallAncillaryShieldBooster, ACTIVE, None)
+    base = {'ship': TYPE_Rifter, 'drones': {TYPE_WarriorI: 2}}
+    return dict(base, modules=modules), dict(base, modules=swapped)
+
+
+def main(swaps=100000):
+    fits = make_fits()
+    ctx = dogma.Context()
+    ctx.load_fit(fits[0])
+    state = [0]
+
+    def diff():
+        state[0] ^= 1
+        ctx.apply_fit_diff(fits[state[0]])
+        ctx.get_ship_attribute(ATT_MaxVelocity)
+
+    def reload():
+        state[0] ^= 1
+        ctx.reset()
+        ctx.load_fit(fits[state[0]])
+        ctx.get_ship_attribute(ATT_MaxVelocity)
+
+    for name, fn in [("apply_fit_diff", diff), ("reset + load_fit", reload)]:
+        print("  %-40s %12.0f swaps/s" % (name, 1 / per_call(fn, swaps)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,62 @@
+"""Building a 250-member fleet with one call per member against
+FleetContext.from_tree, and moving a few members with apply_tree."""
+import sys
+
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+
+def make_tree(members):
+    """5 wings of 5 squads of 10, commanders taken from the front."""
+    members = iter(members)
+    tree = {'commander': next(members), 'wings': []}
+    tree['booster'] = tree['commander']
+    for w in range(5):
+        wing = {'commander': next(members), 'squads': []}
+        for s in range(5):
+            squad = {'commander': next(members), 'members': []}
+            for m in range(8):
+                squad['members'].append(next(members))
+            wing['squads'].append(squad)
+        tree['wings'].append(wing)
+    return tree
+
+
+def build_by_calls(tree):
+    fleet = dogma.FleetContext()
+    fleet.add_fleet_commander(tree['commander'])
+    fleet.set_fleet_booster(tree['booster'])
+    for w, wing in enumerate(tree['wings']):
+        fleet.add_wing_commander(w, wing['commander'])
+        for s, squad in enumerate(wing['squads']):
+            fleet.add_squad_commander(w, s, squad['commander'])
+            for member in squad['members']:
+                fleet.add_squad_member(w, s, member)
+    return fleet
+
+
+def main(rounds=5):
+    members = [dogma.Context() for i in range(256)]
+    for ctx in members:
+        ctx.set_ship(TYPE_Rifter)
+    tree = make_tree(members)
+
+    print("  %-40s %12.3f ms" % ("one call per member",
+                                 per_call(lambda: build_by_calls(tree), rounds) * 1e3))
+    print("  %-40s %12.3f ms" % ("FleetContext.from_tree",
+                                 per_call(lambda: dogma.FleetContext.from_tree(tree), rounds) * 1e3))
+
+    fleet = dogma.FleetContext.from_tree(tree)
+    squads = tree['wings'][0]['squads']
+    def swap():
+        squads[0]['members'][0], squads[1]['members'][0] = \
+            squads[1]['members'][0], squads[0]['members'][0]
+        fleet.apply_tree(tree)
+    print("  %-40s %12.3f ms" % ("apply_tree, two members swapped",
+                                 per_call(swap, rounds) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
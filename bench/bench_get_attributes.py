@@ -0,0 +1,49 @@
+"""Per-value cost of Context.get_attributes against a loop of getters."""
+import dogma
+
+from bench.common import per_call, report
+from test_dogma_values import *
+
+ATTRIBUTES = [ATT_CapacitorNeed, ATT_MaxLockedTargets, ATT_LauncherSlotsLeft,
+              ATT_DroneBandwidthUsed, ATT_CapacitorBonus]
+
+
+def make_context():
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    slots = [ctx.add_module(TYPE_125mmGatlingAutoCannonII,
+                            state=dogma.State.ACTIVE, charge=TYPE_BarrageS)
+             for i in range(3)]
+    slots.append(ctx.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE))
+    ctx.add_drone(TYPE_WarriorI, 2)
+    locations = [dogma.Location.ship(), dogma.Location.drone(TYPE_WarriorI)]
+    locations += [dogma.Location.module(slot) for slot in slots]
+    locations += [dogma.Location.charge(slot) for slot in slots[:3]]
+    return ctx, locations
+
+
+def main():
+    ctx, locations = make_context()
+    cells = len(locations) * len(ATTRIBUTES)
+
+    def loop():
+        for location in locations:
+            for attribute in ATTRIBUTES:
+                try:
+                    ctx.get_location_attribute(location, attribute)
+                except dogma.DogmaException:
+                    pass
+
+    out, status = ctx.get_attributes(locations, ATTRIBUTES)
+
+    def bulk():
+        ctx.get_attributes(locations, ATTRIBUTES, out=out, status=status)
+
+    report("per value, %d cells" % cells, [
+        ("get_location_attribute loop", per_call(loop, 200) / cells),
+        ("get_attributes", per_call(bulk, 200) / cells),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Throughput of the streaming EFT importer on a generated corpus.
+
+Writes lines lines of EFT blocks to a temporary file, then times parsing
+alone and parsing plus evaluation on one context, reporting the peak
+resident memory after each pass (which should not grow with the corpus).
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import dogma
+import dogma_io
+
+from test_dogma_values import *
+
+TYPES = {'Rifter': TYPE_Rifter,
+         'Small Ancillary Shield Booster': TYPE_SmallAncillaryShieldBooster,
+         'Cap Booster 25': TYPE_CapBooster25,
+         'Stasis Webifier I': TYPE_StasisWebifierI,
+         '125mm Gatling AutoCannon II': TYPE_125mmGatlingAutoCannonII,
+         'Barrage S': TYPE_BarrageS,
+         'Warrior I': TYPE_WarriorI}
+
+BLOCK = """[Rifter, fit %d]
+125mm Gatling AutoCannon II, Barrage S
+125mm Gatling AutoCannon II, Barrage S
+125mm Gatling AutoCannon II, Barrage S
+
+Stasis Webifier I
+Small Ancillary Shield Booster, Cap Booster 25
+
+Warrior I x%d
+
+"""
+BLOCK_LINES = BLOCK.count('\n')
+
+
+def write_corpus(f, lines):
+    for i in range(lines // BLOCK_LINES):
+        f.write(BLOCK % (i, i % 3 + 1))
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main(lines=2000000):
+    fd, path = tempfile.mkstemp(suffix='.eft')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write_corpus(f, lines)
+        print("  corpus: %d lines, %.1f MB" % (lines,
+                                               os.path.getsize(path) / 1e6))
+
+        start = time.time()
+        fits = sum(1 for _ in dogma_io.parse_eft(path, TYPES))
+        elapsed = time.time() - start
+        print("  %-30s %10.0f lines/s %8.0f fits/s  peak %.0f MB"
+              % ("parse_eft", lines / elapsed, fits / elapsed, peak_rss()))
+
+        attributes = [(dogma.Location.ship(), ATT_MaxVelocity),
+                      (('module', 0), ATT_CapacitorNeed)]
+        start = time.time()
+        fits = 0
+        for fit_id, values, status in dogma_io.evaluate_eft(path, TYPES,
+                                                            attributes):
+            fits += 1
+        elapsed = time.time() - start
+        print("  %-30s %10.0f lines/s %8.0f fits/s  peak %.0f MB"
+              % ("evaluate_eft", lines / elapsed, fits / elapsed, peak_rss()))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""Dict lookups and attribute reads keyed by Location.
+
+"fresh" builds a new Location struct each time and keys dicts on its
+string form, as Location used to; "interned" uses the factory methods.
+"""
+import dogma
+
+from bench.common import per_call, report
+from test_dogma_values import *
+
+Location = dogma.Location
+
+
+def fresh_module(index):
+    return Location(type=Location.MODULE,
+                    union=dogma.LocationUnion(module_index=index))
+
+
+def main():
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    slots = [ctx.add_module(TYPE_125mmGatlingAutoCannonII) for i in range(8)]
+    by_str = dict((str(fresh_module(slot)), slot) for slot in slots)
+    by_location = dict((Location.module(slot), slot) for slot in slots)
+
+    def lookup_fresh():
+        for slot in slots:
+            by_str[str(fresh_module(slot))]
+
+    def lookup_interned():
+        for slot in slots:
+            by_location[Location.module(slot)]
+
+    def read_fresh():
+        for slot in slots:
+            ctx.get_location_attribute(fresh_module(slot), ATT_CapacitorNeed)
+
+    def read_interned():
+        for slot in slots:
+            ctx.get_location_attribute(Location.module(slot), ATT_CapacitorNeed)
+
+    n = len(slots)
+    report("per call", [
+        ("dict lookup, fresh", per_call(lookup_fresh, 5000) / n),
+        ("dict lookup, interned", per_call(lookup_interned, 5000) / n),
+        ("get_location_attribute, fresh", per_call(read_fresh, 5000) / n),
+        ("get_location_attribute, interned", per_call(read_interned, 5000) / n),
+    ])
+
+
+if __name__ == '__main__':
+    main()
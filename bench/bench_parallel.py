@@ -0,0 +1,35 @@
+"""Fits per second through ParallelEvaluator from 1 to N processes."""
+import multiprocessing
+import sys
+import time
+
+import dogma
+import dogma_parallel
+
+from bench.bench_fit_diff import make_fits
+from test_dogma_values import *
+
+ATTRIBUTES = [(dogma.Location.ship(), ATT_MaxVelocity),
+              (dogma.Location.ship(), ATT_MaxLockedTargets),
+              (('module', 0), ATT_CapacitorNeed),
+              (('charge', 0), ATT_CapacitorBonus)]
+
+
+def main(count=20000, max_processes=None):
+    fits = make_fits() * (count // 2)
+    max_processes = max_processes or multiprocessing.cpu_count()
+    processes = 1
+    while True:
+        with dogma_parallel.ParallelEvaluator(ATTRIBUTES, processes) as evaluator:
+            start = time.time()
+            for result in evaluator.evaluate(fits, ordered=False):
+                pass
+            elapsed = time.time() - start
+        print("  %3d processes %12.0f fits/s" % (processes, len(fits) / elapsed))
+        if processes >= max_processes:
+            break
+        processes = min(processes * 2, max_processes)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,56 @@
+"""A 10 x 10 projection matrix: target/read/clear_target per pair and
+module through the Context API against dogma_projection."""
+import sys
+
+import dogma
+import dogma_projection
+
+from bench.common import per_call
+from test_dogma_values import *
+
+ACTIVE = dogma.State.ACTIVE
+
+
+def make_contexts(count):
+    attackers = []
+    for i in range(count):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        ctx.add_module(TYPE_StasisWebifierI, state=ACTIVE)
+        ctx.add_module(TYPE_StasisWebifierI, state=ACTIVE)
+        ctx.add_module(TYPE_125mmGatlingAutoCannonII, state=ACTIVE)
+        attackers.append(ctx)
+    targets = []
+    for i in range(count):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Scimitar if i % 2 else TYPE_Rifter)
+        targets.append(ctx)
+    return attackers, targets
+
+
+def naive(attackers, targets, attributes):
+    values = []
+    for attacker in attackers:
+        locations = [dogma.Location.module(slot) for slot in attacker._modules]
+        for target in targets:
+            for location in locations:
+                attacker.target(location, target)
+            values.extend(target.get_location_attribute(location, attribute)
+                          for location, attribute in attributes)
+            for location in locations:
+                attacker.clear_target(location)
+    return values
+
+
+def main(count=10, rounds=20):
+    attackers, targets = make_contexts(count)
+    attributes = [(dogma.Location.ship(), ATT_MaxVelocity)]
+    for name, fn in [
+            ("target/read/clear_target", lambda: naive(attackers, targets, attributes)),
+            ("projection_matrix", lambda: dogma_projection.projection_matrix(
+                attackers, targets, attributes))]:
+        print("  %-40s %12.3f ms" % (name, per_call(fn, rounds) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,50 @@
+"""Distribution of ship attributes over booster side effects: toggling
+every effect for each combination against side_effect_distribution, cold
+and with its per-combination cache warm."""
+import itertools
+import sys
+
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+BOOSTERS = [TYPE_StrongBluePillBooster]
+
+
+def naive(ctx, effects, pairs):
+    results = []
+    for combination in itertools.product([False, True], repeat=len(effects)):
+        for (location, effect, chance), on in zip(effects, combination):
+            ctx.toggle_chance_based_effect(location, effect, on)
+        results.append(ctx.get_location_attributes(pairs))
+    for location, effect, chance in effects:
+        ctx.toggle_chance_based_effect(location, effect, False)
+    return results
+
+
+def main(rounds=20):
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    for booster in BOOSTERS:
+        ctx.add_implant(booster)
+    ship = dogma.Location.ship()
+    pairs = [(ship, ATT_ShieldCapacity), (ship, ATT_MaxVelocity)]
+    effects = ctx.chance_based_effects()
+
+    def cold():
+        ctx._side_effect_cache = None
+        ctx.side_effect_distribution(pairs, effects=effects)
+
+    print("  %d chance-based effects" % len(effects))
+    for name, fn in [
+            ("toggle every effect per combination",
+             lambda: naive(ctx, effects, pairs)),
+            ("side_effect_distribution (cold)", cold),
+            ("side_effect_distribution (cached)",
+             lambda: ctx.side_effect_distribution(pairs, effects=effects))]:
+        print("  %-40s %12.3f ms" % (name, per_call(fn, rounds) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
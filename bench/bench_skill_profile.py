@@ -0,0 +1,55 @@
+"""Evaluating one fit under 50 pilots: apply_skill_profile against
+reset_skill_levels followed by a set_skill_level call per skill."""
+import random
+import sys
+
+import dogma
+
+from bench.common import per_call
+from test_dogma_values import *
+
+SKILLS = list(range(3300, 3600))
+
+
+def make_profiles(count=50, seed=0):
+    """Pilots sharing most of their training, each differing from a common
+    base in 30 of 250 skills."""
+    rng = random.Random(seed)
+    base = dict((skill, rng.choice([3, 4, 5, 5]))
+                for skill in rng.sample(SKILLS, 250))
+    profiles = []
+    for i in range(count):
+        levels = dict(base)
+        for skill in rng.sample(sorted(base), 30):
+            levels[skill] = rng.randint(0, 5)
+        profiles.append(dogma.SkillProfile(levels, default_level=0))
+    return profiles
+
+
+def main(rounds=20):
+    profiles = make_profiles()
+    dicts = [dict(profile.items()) for profile in profiles]
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+
+    def apply_profiles():
+        for profile in profiles:
+            ctx.apply_skill_profile(profile)
+            ctx.get_ship_attribute(ATT_MaxVelocity)
+
+    def set_levels():
+        for levels in dicts:
+            ctx.reset_skill_levels()
+            ctx.set_default_skill_level(0)
+            for skill, level in levels.items():
+                ctx.set_skill_level(skill, level)
+            ctx.get_ship_attribute(ATT_MaxVelocity)
+
+    for name, fn in [("apply_skill_profile", apply_profiles),
+                     ("reset + set_skill_level", set_levels)]:
+        print("  %-40s %12.0f profiles/s"
+              % (name, len(profiles) / per_call(fn, rounds)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,30 @@
+"""skill_sweep over 100 skills for a handful of ship and module
+attributes, as a training planner would run it per request."""
+import sys
+
+import dogma
+
+from bench.common import per_call
+from bench.bench_fit_diff import make_fits
+from test_dogma_values import *
+
+SKILLS = list(range(3300, 3400))
+
+
+def main(rounds=10):
+    ctx = dogma.Context()
+    slots = ctx.load_fit(make_fits()[0])['modules']
+    ship = dogma.Location.ship()
+    pairs = [(ship, ATT_MaxVelocity), (ship, ATT_MaxLockedTargets),
+             (dogma.Location.char(), ATT_MaxActiveDrones),
+             (dogma.Location.module(slots[0]), ATT_CapacitorNeed)]
+
+    def sweep():
+        ctx.skill_sweep(SKILLS, pairs)
+
+    print("  %-40s %12.3f ms" % ("skill_sweep (100 skills)",
+                                 per_call(sweep, rounds) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,64 @@
+"""Cumulative output of a fit's modules over a ten minute fight, on a
+fine (plotting) and a coarse grid: a per-activation event loop against
+dogma_timeline."""
+import heapq
+import sys
+
+import dogma
+import dogma_timeline
+
+from bench.common import per_call
+from test_dogma_values import *
+
+
+def event_loop(cycles, times):
+    """Step through every activation and reload, as one would without
+    closed forms."""
+    width = len(times)
+    values = [0.0] * (len(cycles) * width)
+    for i in range(len(cycles)):
+        duration = cycles.durations[i]
+        count = cycles.cycles[i]
+        events = [(0.0, 0)]
+        output = 0.0
+        j = 0
+        while events and j < width:
+            start, done = heapq.heappop(events)
+            while j < width and times[j] < start:
+                values[i * width + j] = output
+                j += 1
+            output += cycles.amounts[i]
+            done += 1
+            if count and done % count == 0:
+                heapq.heappush(events, (start + duration + cycles.reloads[i],
+                                        done))
+            else:
+                heapq.heappush(events, (start + duration, done))
+        while j < width:
+            values[i * width + j] = output
+            j += 1
+    return values
+
+
+def main(rounds=5):
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    for i in range(3):
+        ctx.add_module(TYPE_125mmGatlingAutoCannonII, state=dogma.State.ACTIVE,
+                       charge=TYPE_BarrageS)
+    ctx.add_module(TYPE_SmallAncillaryShieldBooster, state=dogma.State.ACTIVE,
+                   charge=TYPE_CapBooster25)
+    cycles = dogma_timeline.collect(ctx)
+    print("  %-40s %12.3f ms" % ("collect", per_call(
+        lambda: dogma_timeline.collect(ctx), rounds) * 1e3))
+
+    for step in [100.0, 60000.0]:
+        times = [t * step for t in range(int(600000 / step) + 1)]
+        for name, fn in [
+                ("event loop", lambda: event_loop(cycles, times)),
+                ("timeline", lambda: dogma_timeline.timeline(cycles, times))]:
+            print("  %-40s %12.3f ms" % ("%s (%g ms grid)" % (name, step),
+                                         per_call(fn, rounds) * 1e3))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,31 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks are run from the repository root, e.g.
+
+    python -m bench.bench_get_attributes
+"""
+import timeit
+
+
+def per_call(fn, number, repeat=3):
+    """Return the best mean time in seconds of a call to fn."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def report(title, results):
+    print(title)
+    for name, value in results:
+        print("  %-40s %12.3f us" % (name, value * 1e6))
+
+
+def rate(fn, min_time=0.2, repeat=3):
+    """Return the best calls per second of fn over repeat runs of at least
+    min_time seconds each."""
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            break
+        number *= max(2, int(min_time / max(elapsed, 1e-9) * 1.2))
+    best = min([elapsed] + timeit.repeat(fn, number=number, repeat=repeat - 1))
+    return number / best
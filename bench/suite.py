@@ -0,0 +1,252 @@
+"""The benchmark suite covering every binding path, with JSON output and
+a regression check against a saved run.
+
+    python -m bench.suite                            # print results
+    python -m bench.suite --json run.json            # and save them
+    python -m bench.suite --compare base.json [--threshold 0.1]
+
+With --compare the exit status is 1 if any result is worse than the
+baseline by more than the threshold (a fraction). Results are rates
+(higher is better), or import times and sizes (lower is better); all
+typeids come from test_dogma_values.
+"""
+import gc
+import json
+import optparse
+import platform
+import subprocess
+import sys
+import time
+
+import dogma
+
+from bench.common import rate
+from test_dogma_values import *
+
+ACTIVE = dogma.State.ACTIVE
+ONLINE = dogma.State.ONLINE
+
+
+class Results(object):
+    def __init__(self, min_time):
+        self.min_time = min_time
+        self.results = {}
+
+    def rate(self, name, fn, unit='calls/s', scale=1):
+        value = rate(fn, self.min_time) * scale
+        self.add(name, value, unit, True)
+
+    def add(self, name, value, unit, higher_is_better):
+        self.results[name] = {'value': value, 'unit': unit,
+                              'higher_is_better': higher_is_better}
+        print("  %-50s %14.1f %s" % (name, value, unit))
+
+
+def fitted_context(modules=4):
+    ctx = dogma.Context()
+    ctx.set_ship(TYPE_Rifter)
+    slots = [ctx.add_module(TYPE_125mmGatlingAutoCannonII, state=ACTIVE,
+                            charge=TYPE_BarrageS)
+             for i in range(modules)]
+    return ctx, slots
+
+
+def bench_lifecycle(results):
+    results.rate('lifecycle/Context', dogma.Context)
+    results.rate('lifecycle/FleetContext', dogma.FleetContext)
+    results.rate('lifecycle/Context with ship', lambda: dogma.Context().set_ship(TYPE_Rifter))
+
+
+def bench_getters(results):
+    ctx, slots = fitted_context(1)
+    slot = slots[0]
+    implant = ctx.add_implant(TYPE_SnakeOmega)
+    ctx.add_drone(TYPE_WarriorI, 2)
+    ship = dogma.Location.ship()
+    for name, fn in [
+            ('get_location_attribute',
+             lambda: ctx.get_location_attribute(ship, ATT_MaxVelocity)),
+            ('get_character_attribute',
+             lambda: ctx.get_character_attribute(ATT_MaxActiveDrones)),
+            ('get_implant_attribute',
+             lambda: ctx.get_implant_attribute(implant, ATT_Implantness)),
+            ('get_skill_attribute',
+             lambda: ctx.get_skill_attribute(TYPE_Drones, ATT_SkillLevel)),
+            ('get_ship_attribute',
+             lambda: ctx.get_ship_attribute(ATT_MaxVelocity)),
+            ('get_module_attribute',
+             lambda: ctx.get_module_attribute(slot, ATT_CapacitorNeed)),
+            ('get_charge_attribute',
+             lambda: ctx.get_charge_attribute(slot, ATT_CapacitorNeed)),
+            ('get_drone_attribute',
+             lambda: ctx.get_drone_attribute(TYPE_WarriorI,
+                                             ATT_DroneBandwidthUsed))]:
+        results.rate('read/' + name, fn, 'reads/s')
+
+    pairs = [(ship, ATT_MaxVelocity), (ship, ATT_MaxLockedTargets),
+             (dogma.Location.module(slot), ATT_CapacitorNeed),
+             (dogma.Location.drone(TYPE_WarriorI), ATT_DroneBandwidthUsed)]
+    results.rate('read/get_location_attributes',
+                 lambda: ctx.get_location_attributes(pairs), 'reads/s',
+                 len(pairs))
+
+
+def bench_modules(results):
+    ctx, slots = fitted_context(3)
+
+    def add_remove():
+        ctx.remove_module(ctx.add_module(TYPE_StasisWebifierI))
+
+    def add_remove_charged():
+        ctx.remove_module(ctx.add_module(TYPE_125mmGatlingAutoCannonII,
+                                         state=ACTIVE, charge=TYPE_BarrageS))
+
+    states = [ACTIVE, ONLINE]
+    def toggle():
+        states.reverse()
+        ctx.set_module_state(slots[0], states[0])
+
+    def toggle_read():
+        toggle()
+        ctx.get_ship_attribute(ATT_MaxVelocity)
+
+    results.rate('modules/add_module + remove_module', add_remove, 'pairs/s')
+    results.rate('modules/add_module(state, charge) + remove_module',
+                 add_remove_charged, 'pairs/s')
+    results.rate('modules/set_module_state', toggle, 'calls/s')
+    results.rate('modules/set_module_state + read', toggle_read, 'calls/s')
+
+
+def bench_scaling(results):
+    for count in (0, 4, 8, 16):
+        ctx, slots = fitted_context(count)
+        ship = dogma.Location.ship()
+        results.rate('scaling/get_affectors(ship), %d modules' % count,
+                     lambda: ctx.get_affectors(ship))
+        results.rate('scaling/get_capacitor_all, %d modules' % count,
+                     lambda: ctx.get_capacitor_all(False))
+
+    for count in (1, 2, 4, 8):
+        contexts = [fitted_context(2)[0] for i in range(count)]
+        for ctx, targetee in zip(contexts, contexts[1:]):
+            slot = ctx.add_module(TYPE_StasisWebifierI, state=ACTIVE)
+            ctx.target(dogma.Location.module(slot), targetee)
+        results.rate('scaling/get_capacitor_all, %d linked contexts' % count,
+                     lambda: contexts[0].get_capacitor_all(False))
+
+
+def resident_memory():
+    """Resident set size in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError):
+        return None
+    import resource
+    return pages * resource.getpagesize()
+
+
+def bench_memory(results, count=2000):
+    for name, make in [('memory/Context', dogma.Context),
+                       ('memory/Context with 4 modules',
+                        lambda: fitted_context(4)[0])]:
+        gc.collect()
+        before = resident_memory()
+        if before is None:
+            return
+        contexts = [make() for i in range(count)]
+        after = resident_memory()
+        results.add(name, float(after - before) / count, 'bytes/context',
+                    False)
+        del contexts
+        gc.collect()
+
+
+def import_time(code, repeat=5):
+    """Best wall time in seconds of a fresh interpreter running code, to
+    compare import dogma alone against import with libdogma's init."""
+    command = [sys.executable, '-c', code]
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call(command)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_import(results):
+    baseline = import_time('pass')
+    for name, code in [('import/import dogma', 'import dogma'),
+                       ('import/import dogma + init',
+                        'import dogma; dogma.init()')]:
+        results.add(name, (import_time(code) - baseline) * 1e3, 'ms', False)
+
+
+GROUPS = [('import', bench_import),
+          ('lifecycle', bench_lifecycle),
+          ('getters', bench_getters),
+          ('modules', bench_modules),
+          ('scaling', bench_scaling),
+          ('memory', bench_memory)]
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every result against baseline and return the
+    names of those worse by more than threshold."""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        new = results[name]['value']
+        old = baseline[name]['value']
+        if not old:
+            continue
+        change = new / old - 1
+        if not results[name]['higher_is_better']:
+            change = -change
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print("  %-50s %+7.1f%%%s" % (name, change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options] [group ...]')
+    parser.add_option('--json', help='write the results to this file')
+    parser.add_option('--compare', metavar='JSON',
+                      help='compare against the results in this file')
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help='allowed fractional slowdown (default 0.1)')
+    parser.add_option('--min-time', type='float', default=0.2,
+                      help='seconds per timing run (default 0.2)')
+    options, groups = parser.parse_args(argv)
+
+    results = Results(options.min_time)
+    for group, bench in GROUPS:
+        if not groups or group in groups:
+            print(group)
+            bench(results)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'results': results.results}, f, indent=1,
+                      sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+        print("against %s" % options.compare)
+        regressions = compare(results.results, baseline, options.threshold)
+        if regressions:
+            print("%d regression(s) beyond %.0f%%"
+                  % (len(regressions), options.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,31 @@
+import os
+import random
+import threading
+import time
 import weakref
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque, namedtuple
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from contextlib import contextmanager
 from ctypes import *
+from ctypes import _SimpleCData
+from types import FunctionType
 
 # TODO: cross-platform support
-libdogma = cdll.LoadLibrary("libdogma.so")
+LIBRARY_PATH = "libdogma.so"
+
+class LazyLibrary(object):
+    """Stands in for libdogma until a binding first uses it. Any attribute
+    lookup runs init(), which replaces this module's libdogma global with
+    the loaded library, so later calls go straight to ctypes."""
+    def __getattr__(self, name):
+        return getattr(init(), name)
+
+libdogma = LazyLibrary()
 
 
 # datatypes
@@ -19,7 +42,20 @@ class LocationUnion(Union):
                 ("skill_typeid", typeid_t),
                 ("drone_typeid", typeid_t)]
 
+    def __setattr__(self, name, value):
+        # the union of a Location shares its memory
+        base = self._b_base_
+        if isinstance(base, Location) and 'key' in base.__dict__:
+            raise AttributeError("Locations are immutable")
+        Union.__setattr__(self, name, value)
+
 class Location(Structure):
+    """Where an entity lives within a context.
+
+    Locations are immutable, compare and hash by their key, and are
+    interned: the factory methods below return the same instance (and so
+    the same ctypes struct) every time for the same location.
+    """
     _fields_ = [("type", c_int),
                 ("union", LocationUnion)]
 
@@ -31,58 +67,102 @@ class Location(Structure):
     CHARGE = 5
     DRONE = 6
 
+    _union_fields = {IMPLANT: 'implant_index',
+                     SKILL: 'skill_typeid',
+                     MODULE: 'module_index',
+                     CHARGE: 'module_index',
+                     DRONE: 'drone_typeid'}
+    _interned = {}
+
+    def __init__(self, *args, **kwargs):
+        Structure.__init__(self, *args, **kwargs)
+        # key is the (type, index or typeid) tuple identifying the location.
+        self.__dict__['key'] = self._key()
+
+    def _key(self):
+        field = Location._union_fields.get(self.type)
+        return (self.type, getattr(self.union, field) if field else 0)
+
+    def __getattr__(self, name):
+        # Locations made by from_buffer() and the like skip __init__; they
+        # are views of memory which may change, so their key is not kept
+        if name == 'key':
+            return self._key()
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if 'key' in self.__dict__:
+            raise AttributeError("Locations are immutable")
+        Structure.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (intern_location, self.key)
+
     def __str__(self):
-        value = ''
-        if self.type == Location.IMPLANT:
-            value = self.union.implant_index
-        elif self.type in (Location.MODULE, Location.CHARGE):
-            value = self.union.module_index
-        elif self.type == Location.SKILL:
-            value = self.union.skill_typeid
-        elif self.type == Location.DRONE:
-            value = self.union.drone_typeid
-        return str(self.type)+':'+str(value)
+        type, value = self.key
+        if type not in Location._union_fields:
+            value = ''
+        return str(type)+':'+str(value)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.key)
 
-    def __cmp__(self, other):
+    def __eq__(self, other):
         if not isinstance(other, Location):
-            raise Exception("invalid comparison")
-        return cmp(str(self), str(other))
+            return NotImplemented
+        return self.key == other.key
+
+    def __ne__(self, other):
+        if not isinstance(other, Location):
+            return NotImplemented
+        return self.key != other.key
+
+    def __lt__(self, other):
+        return self.key < other.key
 
     @staticmethod
     def char():
-        return Location(type=Location.CHAR)
+        return intern_location(Location.CHAR)
 
     @staticmethod
     def implant(index):
-        return Location(type=Location.IMPLANT,
-                        union=LocationUnion(implant_index=index))
+        return intern_location(Location.IMPLANT, index)
 
     @staticmethod
     def skill(typeid):
-        return Location(type=Location.SKILL,
-                        union=LocationUnion(skill_typeid=typeid))
+        return intern_location(Location.SKILL, typeid)
 
     @staticmethod
     def ship():
-        return Location(type=Location.SHIP)
+        return intern_location(Location.SHIP)
 
     @staticmethod
     def module(index):
-        return Location(type=Location.MODULE,
-                        union=LocationUnion(module_index=index))
+        return intern_location(Location.MODULE, index)
 
     @staticmethod
     def charge(index):
-        return Location(type=Location.CHARGE,
-                        union=LocationUnion(module_index=index))
+        return intern_location(Location.CHARGE, index)
 
     @staticmethod
     def drone(typeid):
-        return Location(type=Location.DRONE,
-                        union=LocationUnion(drone_typeid=typeid))
+        return intern_location(Location.DRONE, typeid)
+
+
+def intern_location(type, value=0):
+    """Return the Location of the given type and index or typeid."""
+    try:
+        return Location._interned[(type, value)]
+    except KeyError:
+        pass
+    field = Location._union_fields.get(type)
+    if field:
+        location = Location(type=type, union=LocationUnion(**{field: value}))
+    else:
+        location = Location(type=type)
+    location = Location._interned.setdefault(location.key, location)
+    Location._interned[(type, value)] = location
+    return location
 
 
 class State(object):
@@ -93,6 +173,14 @@ class State(object):
     OVERLOADED = 63
 state_t = c_int
 
+DEFAULT_SKILL_LEVEL = 5
+MAX_SKILL_LEVEL = 5
+
+# side_effect_distribution enumerates every combination of up to this
+# many chance-based effects, and samples combinations beyond it
+MAX_EXACT_SIDE_EFFECTS = 10
+DEFAULT_SIDE_EFFECT_SAMPLES = 4096
+
 
 # dogma-extra.h datatypes
 
@@ -111,6 +199,61 @@ class SimpleAffector(Structure):
         data = dict((field, getattr(self, field)) for field, _ in self._fields_)
         return SimpleAffector(**data)
 
+class NativeList(object):
+    """Owns a list allocated by libdogma and frees it once nothing (including
+    views into it) refers to it any more."""
+    def __init__(self, pointer, free):
+        self.pointer = pointer
+        self.free = free
+
+    def __del__(self):
+        if self.pointer:
+            chk(self.free(self.pointer))
+
+class AffectorList(object):
+    """The affectors of a location, left in the buffer libdogma returned.
+
+    Behaves as a read-only sequence of SimpleAffector views into that buffer;
+    the buffer itself is available as a ctypes array (array), a memoryview
+    (memoryview()) or a NumPy structured array (as_numpy()), without any
+    per-affector Python objects. It is freed once the list and every view
+    are gone.
+    """
+    def __init__(self, affectors, size):
+        self.buffer = NativeList(affectors,
+                                 lambda p: libdogma.dogma_free_affector_list(p))
+        if size:
+            self.array = (SimpleAffector * size).from_address(
+                addressof(affectors.contents))
+        else:
+            self.array = (SimpleAffector * 0)()
+        self.array._owner = self.buffer
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def memoryview(self):
+        return memoryview(self.array)
+
+    def as_numpy(self):
+        import numpy
+        return numpy.frombuffer(self.array, numpy.dtype(SimpleAffector))
+
+    def filter(self, destid=None, flags=0, without=0):
+        """Return the affectors of destid (or of any attribute) which have
+        all of flags and none of without set, e.g.
+        filter(flags=AFFECTOR_PENALIZED)."""
+        return [affector for affector in self.array
+                if (destid is None or affector.destid == destid)
+                and affector.flags & flags == flags
+                and not affector.flags & without]
+
 class SimpleCapacitorUnion(Union):
     _fields_ = [("stable_fraction", c_double),
                 ("depletion_time", c_double)]
@@ -141,6 +284,115 @@ class SimpleCapacitor(Structure):
         return SimpleCapacitor(**data)
 
 
+class CapacitorList(Mapping):
+    """Results of get_capacitor_all, left in the buffer libdogma returned.
+
+    A read-only mapping from each Context involved to a SimpleCapacitor view
+    into that buffer. The records themselves are available in order as a
+    ctypes array (array), a memoryview or a NumPy structured array
+    (as_numpy()), with contexts listing the Context of each record.
+    """
+    def __init__(self, capacitors, size):
+        self.buffer = NativeList(
+            capacitors, lambda p: libdogma.dogma_free_capacitor_list(p))
+        if size:
+            self.array = (SimpleCapacitor * size).from_address(
+                addressof(capacitors.contents))
+        else:
+            self.array = (SimpleCapacitor * 0)()
+        self.array._owner = self.buffer
+
+        base = addressof(self.array)
+        offset = SimpleCapacitor.context.offset
+        stride = sizeof(SimpleCapacitor)
+        self.contexts = []
+        self.index = {}
+        for i in range(size):
+            address = c_void_p.from_address(base + i * stride + offset).value
+            context = contexts_by_address[address]
+            self.contexts.append(context)
+            self.index[context] = i
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def __iter__(self):
+        return iter(self.contexts)
+
+    def __getitem__(self, context):
+        return self.array[self.index[context]]
+
+    def __contains__(self, context):
+        return context in self.index
+
+    def memoryview(self):
+        return memoryview(self.array)
+
+    def as_numpy(self):
+        import numpy
+        union = SimpleCapacitor.union.offset
+        dtype = numpy.dtype({
+            'names': ['context', 'capacity', 'delta', 'stable',
+                      'stable_fraction', 'depletion_time'],
+            'formats': [numpy.uintp, numpy.float64, numpy.float64,
+                        numpy.bool_, numpy.float64, numpy.float64],
+            'offsets': [SimpleCapacitor.context.offset,
+                        SimpleCapacitor.capacity.offset,
+                        SimpleCapacitor.delta.offset,
+                        SimpleCapacitor.stable.offset, union, union],
+            'itemsize': sizeof(SimpleCapacitor)})
+        return numpy.frombuffer(self.array, dtype)
+
+
+class EffectAttributes(Structure):
+    """The attributes of one effect at one location, as returned by
+    Context.get_location_effect_attributes."""
+    _fields_ = [("location_type", c_int),
+                ("location_index", key_t),
+                ("typeid", typeid_t),
+                ("effect", effectid_t),
+                ("duration", c_double),
+                ("tracking", c_double),
+                ("discharge", c_double),
+                ("range", c_double),
+                ("falloff", c_double),
+                ("usage_chance", c_double)]
+
+    @property
+    def location(self):
+        return intern_location(self.location_type, self.location_index)
+
+    def copy(self):
+        data = dict((field, getattr(self, field)) for field, _ in self._fields_)
+        return EffectAttributes(**data)
+
+class EffectAttributesList(object):
+    """Results of get_all_effect_attributes.
+
+    A read-only sequence of EffectAttributes views into one buffer, which
+    is also available as a ctypes array (array), a memoryview or a NumPy
+    structured array (as_numpy()).
+    """
+    def __init__(self, size):
+        self.array = (EffectAttributes * size)()
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def memoryview(self):
+        return memoryview(self.array)
+
+    def as_numpy(self):
+        import numpy
+        return numpy.frombuffer(self.array, numpy.dtype(EffectAttributes))
+
+
 # bindings
 
 def _(x): return x
@@ -151,12 +403,37 @@ def accept_or_cast(typ, val):
     else:
         return typ(val)
 
+def unwrap(val):
+    if isinstance(val, _SimpleCData):
+        return val.value
+    return val
+
+def plain(typ, val):
+    """val as a plain value the prototypes accept for typ, e.g. a NumPy
+    integer as an int; None is left alone."""
+    if type(val) is int or val is None:
+        return val
+    return unwrap(accept_or_cast(typ, val))
+
 def sig(*types):
+    """Cast arguments to the given types when ctypes refuses them as-is.
+
+    The libdogma prototypes below let ctypes convert plain Python values
+    itself, so the common case is a straight call; the Python-level casts
+    only run to retry (or fail with the usual error) after an
+    ArgumentError. As the whole method is retried, methods must not
+    record anything before their libdogma call succeeds.
+    """
     def wrap(f):
         def new_f(*values):
-            casted = [accept_or_cast(typ, val) for typ, val in zip(types, values)]
-            return f(*casted)
-        new_f.func_name = f.func_name
+            try:
+                return f(*values)
+            except ArgumentError:
+                casted = [unwrap(accept_or_cast(typ, val))
+                          for typ, val in zip(types, values)]
+                return f(*casted)
+        new_f.__name__ = f.__name__
+        new_f.__doc__ = f.__doc__
         return new_f
     return wrap
 
@@ -164,6 +441,41 @@ OK = 0
 NOT_FOUND = 1
 NOT_APPLICABLE = 2
 
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+class LRUCache(object):
+    """A bounded mapping which evicts the least recently used entry."""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.values.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.values[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        values = self.values
+        values.pop(key, None)
+        values[key] = value
+        if len(values) > self.maxsize:
+            values.popitem(last=False)
+
+    def clear(self):
+        self.values.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self.values))
+
+
 class DogmaException(Exception):
     pass
 
@@ -182,122 +494,934 @@ def chk(ret):
         raise NotApplicableException
     raise AssertionError("impossible return value %r" % ret)
 
-chk(libdogma.dogma_init())
+
+# prototypes
 
 context_t = POINTER(c_void_p)
+fleet_context_t = POINTER(c_void_p)
+
+location_t = Location
+double_p = POINTER(c_double)
+bool_p = POINTER(c_bool)
+
+_prototypes = {
+    'dogma_init': (),
+    'dogma_init_context': (POINTER(context_t),),
+    'dogma_free_context': (context_t,),
+
+    'dogma_add_implant': (context_t, typeid_t, POINTER(key_t)),
+    'dogma_remove_implant': (context_t, key_t),
+
+    'dogma_set_default_skill_level': (context_t, c_uint8),
+    'dogma_set_skill_level': (context_t, typeid_t, c_uint8),
+    'dogma_reset_skill_levels': (context_t,),
+
+    'dogma_set_ship': (context_t, typeid_t),
+
+    'dogma_add_module': (context_t, typeid_t, POINTER(key_t)),
+    'dogma_add_module_s': (context_t, typeid_t, POINTER(key_t), state_t),
+    'dogma_add_module_c': (context_t, typeid_t, POINTER(key_t), typeid_t),
+    'dogma_add_module_sc': (context_t, typeid_t, POINTER(key_t), state_t,
+                            typeid_t),
+    'dogma_remove_module': (context_t, key_t),
+    'dogma_set_module_state': (context_t, key_t, state_t),
+
+    'dogma_add_charge': (context_t, key_t, typeid_t),
+    'dogma_remove_charge': (context_t, key_t),
+
+    'dogma_add_drone': (context_t, typeid_t, c_uint),
+    'dogma_remove_drone_partial': (context_t, typeid_t, c_uint),
+    'dogma_remove_drone': (context_t, typeid_t),
+
+    'dogma_toggle_chance_based_effect': (context_t, location_t, effectid_t,
+                                         c_bool),
+
+    'dogma_target': (context_t, location_t, context_t),
+    'dogma_clear_target': (context_t, location_t),
+
+    'dogma_get_location_attribute': (context_t, location_t, attributeid_t,
+                                     double_p),
+    'dogma_get_character_attribute': (context_t, attributeid_t, double_p),
+    'dogma_get_implant_attribute': (context_t, key_t, attributeid_t,
+                                    double_p),
+    'dogma_get_skill_attribute': (context_t, typeid_t, attributeid_t,
+                                  double_p),
+    'dogma_get_ship_attribute': (context_t, attributeid_t, double_p),
+    'dogma_get_module_attribute': (context_t, key_t, attributeid_t,
+                                   double_p),
+    'dogma_get_charge_attribute': (context_t, key_t, attributeid_t,
+                                   double_p),
+    'dogma_get_drone_attribute': (context_t, typeid_t, attributeid_t,
+                                  double_p),
+
+    'dogma_get_chance_based_effect_chance': (context_t, location_t,
+                                             effectid_t, double_p),
+
+    'dogma_init_fleet_context': (POINTER(fleet_context_t),),
+    'dogma_free_fleet_context': (fleet_context_t,),
+    'dogma_add_fleet_commander': (fleet_context_t, context_t),
+    'dogma_add_wing_commander': (fleet_context_t, key_t, context_t),
+    'dogma_add_squad_commander': (fleet_context_t, key_t, key_t, context_t),
+    'dogma_add_squad_member': (fleet_context_t, key_t, key_t, context_t),
+    'dogma_remove_fleet_member': (fleet_context_t, context_t, bool_p),
+    'dogma_set_fleet_booster': (fleet_context_t, context_t),
+    'dogma_set_wing_booster': (fleet_context_t, key_t, context_t),
+    'dogma_set_squad_booster': (fleet_context_t, key_t, key_t, context_t),
+
+    # dogma-extra.h
+    'dogma_get_affectors': (context_t, location_t,
+                            POINTER(POINTER(SimpleAffector)),
+                            POINTER(c_size_t)),
+    'dogma_free_affector_list': (POINTER(SimpleAffector),),
+    'dogma_type_has_effect': (typeid_t, state_t, effectid_t, bool_p),
+    'dogma_type_has_active_effects': (typeid_t, bool_p),
+    'dogma_type_has_overload_effects': (typeid_t, bool_p),
+    'dogma_type_has_projectable_effects': (typeid_t, bool_p),
+    'dogma_type_base_attribute': (typeid_t, attributeid_t, double_p),
+    'dogma_get_number_of_module_cycles_before_reload': (
+        context_t, key_t, POINTER(c_int)),
+    'dogma_get_capacitor_all': (context_t, c_bool,
+                                POINTER(POINTER(SimpleCapacitor)),
+                                POINTER(c_size_t)),
+    'dogma_free_capacitor_list': (POINTER(SimpleCapacitor),),
+    'dogma_get_nth_type_effect_with_attributes': (typeid_t, c_uint,
+                                                  POINTER(effectid_t)),
+    'dogma_get_location_effect_attributes': (
+        context_t, location_t, effectid_t,
+        double_p, double_p, double_p, double_p, double_p, double_p),
+}
+
+def declare_prototypes(lib):
+    for name, argtypes in _prototypes.items():
+        function = getattr(lib, name)
+        function.argtypes = argtypes
+        function.restype = c_int
+
+def bare_function(name):
+    """Return the libdogma function name without its prototype.
+
+    ctypes converts every argument through argtypes on each call; loops
+    which already hold exact ctypes values (context pointers, Locations,
+    attributeid_t instances, byref() outputs) can skip that conversion.
+    """
+    lib = init()
+    function = lib._FuncPtr((name, lib))
+    function.restype = c_int
+    if _profile is not None and _profile.originals:
+        return _profile.wrap(name, function, True)
+    return function
+
+_init_lock = threading.Lock()
+_loaded_path = None
+
+def init(path=None):
+    """Load libdogma (from path, by default LIBRARY_PATH) and its static
+    data, and return the ctypes library.
+
+    This happens by itself the first time any binding is used; call it
+    explicitly to pay the cost up front, e.g. before forking workers.
+    Later calls return the library already loaded, and raise ValueError
+    if given a path other than the one it was loaded from.
+    """
+    global libdogma, _loaded_path
+    if isinstance(libdogma, LazyLibrary):
+        with _init_lock:
+            if isinstance(libdogma, LazyLibrary):
+                lib = cdll.LoadLibrary(path or LIBRARY_PATH)
+                declare_prototypes(lib)
+                chk(lib.dogma_init())
+                _loaded_path = path or LIBRARY_PATH
+                libdogma = lib
+                if _profile is not None and _profile.originals:
+                    _profile.install_native(lib)
+    if path is not None and path != _loaded_path:
+        raise ValueError("libdogma is already loaded from %s"
+                         % _loaded_path)
+    return libdogma
+
+def native_address(pointer):
+    return cast(pointer, c_void_p).value
+
+# Native dogma_context_t address -> Context, to map the contexts libdogma
+# hands back in results to their Python objects.
+contexts_by_address = weakref.WeakValueDictionary()
+
+def linked_objects(objects):
+    """The set of objects (Contexts and FleetContexts) and of everything
+    reachable from them through targets, targeters and fleets."""
+    seen = set()
+    pending = list(objects)
+    while pending:
+        item = pending.pop()
+        if item in seen:
+            continue
+        seen.add(item)
+        if isinstance(item, FleetContext):
+            pending.extend(item.members)
+            continue
+        pending.extend(item.targets_by_location.values())
+        pending.extend(item.targeters)
+        if item.fleet is not None:
+            pending.append(item.fleet)
+    return seen
+
+def touch_linked(contexts):
+    """Invalidate the cached attributes of contexts and of everything
+    reachable from them through targets, targeters and fleets."""
+    for item in linked_objects(contexts):
+        if isinstance(item, Context):
+            item._generation += 1
+
+def module_spec(entry):
+    """Expand a fit's module entry into a (typeid, state, charge) tuple."""
+    if isinstance(entry, (tuple, list)):
+        if len(entry) == 3:
+            return tuple(entry)
+        if len(entry) == 2:
+            return (entry[0], entry[1], None)
+        return (entry[0], None, None)
+    return (entry, None, None)
+
+def fit_location(location, slots):
+    """Resolve a location given relative to a fit against the slot map
+    returned by load_fit; Locations are returned as they are, and None is
+    returned for entries the fit does not have."""
+    if isinstance(location, Location):
+        return location
+    kind, index = location
+    if kind in ('module', 'charge'):
+        slots = slots['modules']
+    elif kind == 'implant':
+        slots = slots['implants']
+    else:
+        raise ValueError("unknown fit location %r" % (location,))
+    if not 0 <= index < len(slots):
+        return None
+    if kind == 'module':
+        return Location.module(slots[index])
+    elif kind == 'charge':
+        return Location.charge(slots[index])
+    return Location.implant(slots[index])
+
+class SkillProfile(Mapping):
+    """An immutable mapping of skill typeid -> level together with a
+    default level for every other skill, as for one pilot.
+
+    Levels equal to the default are dropped, and the rest are kept in two
+    sorted arrays, so that profiles are small and cheap to compare. Apply
+    one with Context.apply_skill_profile.
+    """
+    def __init__(self, levels=(), default_level=DEFAULT_SKILL_LEVEL):
+        if isinstance(levels, Mapping):
+            levels = levels.items()
+        levels = sorted((skill, level) for skill, level in levels
+                        if level != default_level)
+        self.default_level = default_level
+        self.skills = array('I', [skill for skill, level in levels])
+        self.levels = array('B', [level for skill, level in levels])
+
+    def _find(self, skill):
+        i = bisect_left(self.skills, skill)
+        if i < len(self.skills) and self.skills[i] == skill:
+            return i
+        return None
+
+    def __getitem__(self, skill):
+        i = self._find(skill)
+        if i is None:
+            raise KeyError(skill)
+        return self.levels[i]
+
+    def __contains__(self, skill):
+        return self._find(skill) is not None
+
+    def __iter__(self):
+        return iter(self.skills)
+
+    def __len__(self):
+        return len(self.skills)
+
+    def items(self):
+        return list(zip(self.skills, self.levels))
+
+    def level(self, skill):
+        """The level the profile trains skill to."""
+        i = self._find(skill)
+        return self.default_level if i is None else self.levels[i]
+
+    def __eq__(self, other):
+        if not isinstance(other, SkillProfile):
+            return NotImplemented
+        return (self.default_level == other.default_level and
+                self.skills == other.skills and self.levels == other.levels)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return 'SkillProfile(%r, default_level=%r)' % (
+            dict(self.items()), self.default_level)
+
 class Context(object):
     def __init__(self):
         self._as_parameter_ = context_t()
         
         self.targets_by_location = weakref.WeakValueDictionary()
         self.targeters = weakref.WeakSet()
+        self._fleet = None
+        self._linked = False
+        self._generation = 0
+        self._attribute_cache = None
+        self._attribute_cache_generation = 0
+
+        self._ship = 0
+        self._implants = {}
+        self._modules = {}
+        self._drones = {}
+        self._default_skill_level = DEFAULT_SKILL_LEVEL
+        self._skill_levels = {}
+        self._chance_effects = {}
+        self._side_effect_cache = None
+        self._baseline = None
         chk(libdogma.dogma_init_context(byref(self._as_parameter_)))
+        contexts_by_address[native_address(self._as_parameter_)] = self
 
     def __del__(self):
+        if not getattr(self, '_as_parameter_', None):
+            # dogma_init_context never ran, e.g. libdogma failed to load
+            return
+        # libdogma drops the targets and fleet membership of the context
+        if self._linked:
+            touch_linked([self])
         chk(libdogma.dogma_free_context(self))
 
+    @property
+    def fleet(self):
+        """The FleetContext this context is a member of, if any."""
+        return self._fleet() if self._fleet is not None else None
+
+    def _touch(self):
+        if self._linked:
+            touch_linked([self])
+        else:
+            self._generation += 1
+
+
+    def enable_attribute_cache(self, maxsize=1024):
+        """Memoize attribute reads until the next change to this context
+        or to any context linked to it."""
+        self._attribute_cache = LRUCache(maxsize)
+        self._attribute_cache_generation = self._generation
+
+    def disable_attribute_cache(self):
+        self._attribute_cache = None
+
+    def attribute_cache_info(self):
+        if self._attribute_cache is None:
+            return None
+        return self._attribute_cache.info()
+
+    def _cached_attribute(self, location, attribute):
+        cache = self._attribute_cache
+        if self._attribute_cache_generation != self._generation:
+            cache.clear()
+            self._attribute_cache_generation = self._generation
+        key = (location.key, attribute)
+        value = cache.get(key)
+        if value is None:
+            result = c_double()
+            chk(libdogma.dogma_get_location_attribute(
+                    self, location, attribute, byref(result)))
+            value = result.value
+            cache.put(key, value)
+        return value
+
 
     @sig(_, typeid_t)
     def add_implant(self, implant):
+        self._touch()
         slot = key_t()
         chk(libdogma.dogma_add_implant(self, implant, byref(slot)))
+        self._implants[slot.value] = implant
         return slot.value
 
     @sig(_, key_t)
     def remove_implant(self, slot):
+        self._touch()
         chk(libdogma.dogma_remove_implant(self, slot))
+        del self._implants[slot]
+        key = Location.implant(slot).key
+        for effect in [effect for location, effect in self._chance_effects
+                       if location == key]:
+            del self._chance_effects[(key, effect)]
 
 
     @sig(_, c_uint8)
     def set_default_skill_level(self, level):
+        self._touch()
         chk(libdogma.dogma_set_default_skill_level(self, level))
+        self._default_skill_level = level
 
     @sig(_, typeid_t, c_uint8)
     def set_skill_level(self, skill, level):
+        self._touch()
         chk(libdogma.dogma_set_skill_level(self, skill, level))
+        self._skill_levels[skill] = level
 
     def reset_skill_levels(self):
+        self._touch()
         chk(libdogma.dogma_reset_skill_levels(self))
+        self._skill_levels.clear()
 
 
     @sig(_, typeid_t)
     def set_ship(self, ship):
+        self._touch()
         chk(libdogma.dogma_set_ship(self, ship))
+        self._ship = ship
 
 
     def add_module(self, module, state=None, charge=None):
-        accept_or_cast(typeid_t, module)
-        if state:
-            accept_or_cast(state_t, state)
-        if charge:
-            accept_or_cast(typeid_t, charge)
+        self._touch()
+        slot = key_t()
+        try:
+            if state is None and charge is None:
+                chk(libdogma.dogma_add_module(self, module, byref(slot)))
+            elif charge is None:
+                chk(libdogma.dogma_add_module_s(
+                        self, module, byref(slot), state))
+            elif state is None:
+                chk(libdogma.dogma_add_module_c(
+                        self, module, byref(slot), charge))
+            else:
+                chk(libdogma.dogma_add_module_sc(
+                        self, module, byref(slot), state, charge))
+        except ArgumentError:
+            return self.add_module(unwrap(accept_or_cast(typeid_t, module)),
+                                   unwrap(accept_or_cast(state_t, state)),
+                                   unwrap(accept_or_cast(typeid_t, charge)))
+        self._modules[slot.value] = [module, state, charge]
+        return slot.value
 
+    def load_fit(self, fit):
+        """Apply a whole fit description in one call.
+
+        fit is a mapping with any of the keys:
+
+            'default_skill_level': level
+            'skills': {skill typeid: level}
+            'ship': typeid
+            'implants': [typeid, ...]
+            'modules': [typeid, (typeid, state) or (typeid, state, charge), ...]
+            'drones': {typeid: count}
+
+        Skills are set first, then the ship, and modules are added together
+        with their state and charge. The fit is applied on top of whatever
+        the context already holds. Returns {'implants': [...],
+        'modules': [...]} with the slots in the order they were given.
+        """
+        # cast everything first, so that bad values fail before anything
+        # is applied
+        level = plain(c_uint8, fit.get('default_skill_level'))
+        skills = [(plain(typeid_t, skill), plain(c_uint8, skill_level))
+                  for skill, skill_level in (fit.get('skills') or {}).items()]
+        ship = plain(typeid_t, fit.get('ship'))
+        wanted_implants = [plain(typeid_t, implant)
+                           for implant in fit.get('implants', ())]
+        wanted_modules = []
+        for entry in fit.get('modules', ()):
+            module, state, charge = module_spec(entry)
+            wanted_modules.append((plain(typeid_t, module),
+                                   plain(state_t, state),
+                                   plain(typeid_t, charge)))
+        drones = [(plain(typeid_t, drone), plain(c_uint, count))
+                  for drone, count in (fit.get('drones') or {}).items()]
+
+        self._touch()
+        context = self._as_parameter_
         slot = key_t()
-        if state is None and charge is None:
-            chk(libdogma.dogma_add_module(self, module, byref(slot)))
-        elif charge is None:
-            chk(libdogma.dogma_add_module_s(self, module, byref(slot), state))
-        elif state is None:
-            chk(libdogma.dogma_add_module_c(
-                    self, module, byref(slot), charge))
+        slot_ref = byref(slot)
+
+        if level is not None:
+            chk(libdogma.dogma_set_default_skill_level(context, level))
+            self._default_skill_level = level
+        if skills:
+            set_skill_level = libdogma.dogma_set_skill_level
+            skill_levels = self._skill_levels
+            for skill, level in skills:
+                chk(set_skill_level(context, skill, level))
+                skill_levels[skill] = level
+
+        if ship is not None:
+            chk(libdogma.dogma_set_ship(context, ship))
+            self._ship = ship
+
+        implant_slots = []
+        add_implant = libdogma.dogma_add_implant
+        implants = self._implants
+        for implant in wanted_implants:
+            chk(add_implant(context, implant, slot_ref))
+            implants[slot.value] = implant
+            implant_slots.append(slot.value)
+
+        module_slots = []
+        modules = self._modules
+        for module, state, charge in wanted_modules:
+            if charge is None:
+                if state is None:
+                    chk(libdogma.dogma_add_module(context, module, slot_ref))
+                else:
+                    chk(libdogma.dogma_add_module_s(
+                            context, module, slot_ref, state))
+            elif state is None:
+                chk(libdogma.dogma_add_module_c(
+                        context, module, slot_ref, charge))
+            else:
+                chk(libdogma.dogma_add_module_sc(
+                        context, module, slot_ref, state, charge))
+            modules[slot.value] = [module, state, charge]
+            module_slots.append(slot.value)
+
+        if drones:
+            add_drone = libdogma.dogma_add_drone
+            for drone, count in drones:
+                chk(add_drone(context, drone, count))
+                self._drones[drone] = self._drones.get(drone, 0) + count
+
+        return {'implants': implant_slots, 'modules': module_slots}
+
+    def evaluate_fit(self, fit, attributes):
+        """load_fit, then read (location, attribute) pairs.
+
+        Locations may be given relative to the fit as ('module', i),
+        ('charge', i) or ('implant', i), meaning the slot of the i-th entry
+        of fit['modules'] or fit['implants']. Returns (values, status) as
+        for get_attributes.
+        """
+        slots = self.load_fit(fit)
+        return self.get_location_attributes(
+            [(fit_location(location, slots), attribute)
+             for location, attribute in attributes])
+
+    def evaluate_fits(self, fits, attributes):
+        """Yield (values, status) for each of fits, as from evaluate_fit,
+        or (None, exception) for fits libdogma refuses to load.
+
+        The context is reset() before every fit, which also drops targets
+        and fleet membership; anything set up before the first fit
+        (skills, for instance) becomes the baseline if none was set.
+        """
+        if self._baseline is None:
+            self.set_baseline()
+        attributes = list(attributes)
+        for fit in fits:
+            self.reset()
+            try:
+                result = self.evaluate_fit(fit, attributes)
+            except DogmaException as e:
+                result = None, e
+            yield result
+
+    def get_fit(self):
+        """Describe what is currently applied, in the form load_fit takes.
+        Modules are listed in slot order."""
+        return {'default_skill_level': self._default_skill_level,
+                'skills': dict(self._skill_levels),
+                'ship': self._ship,
+                'implants': [self._implants[slot]
+                             for slot in sorted(self._implants)],
+                'modules': [tuple(self._modules[slot])
+                            for slot in sorted(self._modules)],
+                'drones': dict(self._drones)}
+
+    def apply_fit_diff(self, target_fit):
+        """Turn the current fit into target_fit with as few libdogma calls
+        as possible.
+
+        target_fit has the same form as for load_fit; keys it leaves out
+        are left as they are. Modules which are kept, or only change state
+        or charge, stay in their slot, and new modules reuse the slots
+        freed by removed ones. Returns the same slot map as load_fit.
+        """
+        if 'default_skill_level' in target_fit or 'skills' in target_fit:
+            self._apply_skill_levels(
+                target_fit.get('default_skill_level',
+                               self._default_skill_level),
+                target_fit.get('skills', dict(self._skill_levels)))
+
+        ship = target_fit.get('ship')
+        if ship is not None and ship != self._ship:
+            self.set_ship(ship)
+
+        implant_slots = None
+        if 'implants' in target_fit:
+            wanted = list(target_fit['implants'])
+            implant_slots = [None] * len(wanted)
+            free = {}
+            for slot, implant in sorted(self._implants.items()):
+                free.setdefault(implant, []).append(slot)
+            for i, implant in enumerate(wanted):
+                if free.get(implant):
+                    implant_slots[i] = free[implant].pop(0)
+            for slots in free.values():
+                for slot in slots:
+                    self.remove_implant(slot)
+            for i, implant in enumerate(wanted):
+                if implant_slots[i] is None:
+                    implant_slots[i] = self.add_implant(implant)
+
+        module_slots = None
+        if 'modules' in target_fit:
+            module_slots = self._apply_modules(
+                [module_spec(entry) for entry in target_fit['modules']])
+
+        if 'drones' in target_fit:
+            drones = target_fit['drones']
+            for drone, count in list(self._drones.items()):
+                wanted = drones.get(drone, 0)
+                if wanted <= 0:
+                    self.remove_drone(drone)
+                elif wanted < count:
+                    self.remove_drone_partial(drone, count - wanted)
+            for drone, count in drones.items():
+                missing = count - self._drones.get(drone, 0)
+                if missing > 0:
+                    self.add_drone(drone, missing)
+
+        return {'implants': implant_slots, 'modules': module_slots}
+
+    def apply_skill_profile(self, profile):
+        """Give the character the skill levels of profile (a SkillProfile
+        or a {skill typeid: level} mapping, with the default level left as
+        it is), issuing only the libdogma calls needed to get there."""
+        if isinstance(profile, SkillProfile):
+            self._apply_skill_levels(profile.default_level,
+                                     dict(zip(profile.skills, profile.levels)))
         else:
-            chk(libdogma.dogma_add_module_sc(
-                    self, module, byref(slot), state, charge))
-        return slot.value
+            self._apply_skill_levels(self._default_skill_level, profile)
+
+    def _apply_skill_levels(self, default_skill_level, skill_levels):
+        current = self._skill_levels
+        stale = [skill for skill, level in current.items()
+                 if level != default_skill_level and skill not in skill_levels]
+        changed = [(skill, level) for skill, level in skill_levels.items()
+                   if current.get(skill, default_skill_level) != level]
+        default_changed = default_skill_level != self._default_skill_level
+        if not (stale or changed or default_changed):
+            return
+
+        self._touch()
+        context = self._as_parameter_
+        if default_changed:
+            chk(libdogma.dogma_set_default_skill_level(context,
+                                                       default_skill_level))
+            self._default_skill_level = default_skill_level
+        if 1 + len(skill_levels) < len(stale) + len(changed):
+            # cheaper to start over from the default level
+            chk(libdogma.dogma_reset_skill_levels(context))
+            current.clear()
+            changed = [(skill, level) for skill, level in skill_levels.items()
+                       if level != default_skill_level]
+        else:
+            changed.extend((skill, default_skill_level) for skill in stale)
+        set_skill_level = libdogma.dogma_set_skill_level
+        for skill, level in changed:
+            chk(set_skill_level(context, skill, level))
+            current[skill] = level
+
+    def _apply_modules(self, wanted):
+        slots = [None] * len(wanted)
+        unmatched = dict((slot, tuple(module))
+                         for slot, module in self._modules.items())
+
+        # Exact matches first, then modules of the right type whose state
+        # and charge can be changed in place.
+        by_spec = {}
+        for slot, spec in sorted(unmatched.items()):
+            by_spec.setdefault(spec, []).append(slot)
+        for i, spec in enumerate(wanted):
+            if by_spec.get(spec):
+                slot = by_spec[spec].pop(0)
+                slots[i] = slot
+                del unmatched[slot]
+        by_type = {}
+        for slot, (module, state, charge) in sorted(unmatched.items()):
+            by_type.setdefault(module, []).append((slot, state))
+        for i, (module, state, charge) in enumerate(wanted):
+            if slots[i] is not None:
+                continue
+            candidates = by_type.get(module)
+            if not candidates:
+                continue
+            for j, (slot, current_state) in enumerate(candidates):
+                # There is no way to ask for the default state again
+                # other than re-adding the module.
+                if state is not None or current_state is None:
+                    break
+            else:
+                continue
+            del candidates[j]
+            del unmatched[slot]
+            slots[i] = slot
+
+        for slot in unmatched:
+            self.remove_module(slot)
+        for i, (module, state, charge) in enumerate(wanted):
+            slot = slots[i]
+            if slot is None:
+                slots[i] = self.add_module(module, state, charge)
+                continue
+            current = self._modules[slot]
+            if current[1] != state:
+                self.set_module_state(slot, state)
+            if current[2] != charge:
+                if charge is None:
+                    self.remove_charge(slot)
+                else:
+                    self.add_charge(slot, charge)
+        return slots
 
     @sig(_, key_t)
     def remove_module(self, slot):
+        self._touch()
         chk(libdogma.dogma_remove_module(self, slot))
+        del self._modules[slot]
 
     @sig(_, key_t, state_t)
     def set_module_state(self, slot, state):
+        self._touch()
         chk(libdogma.dogma_set_module_state(self, slot, state))
+        self._modules[slot][1] = state
 
 
     @sig(_, key_t, typeid_t)
     def add_charge(self, slot, charge):
+        self._touch()
         chk(libdogma.dogma_add_charge(self, slot, charge))
+        self._modules[slot][2] = charge
 
     @sig(_, key_t)
     def remove_charge(self, slot):
+        self._touch()
         chk(libdogma.dogma_remove_charge(self, slot))
+        self._modules[slot][2] = None
 
 
     @sig(_, typeid_t, c_uint)
     def add_drone(self, drone, count):
+        self._touch()
         chk(libdogma.dogma_add_drone(self, drone, count))
+        self._drones[drone] = self._drones.get(drone, 0) + count
 
     @sig(_, typeid_t, c_uint)
     def remove_drone_partial(self, drone, count):
+        self._touch()
         chk(libdogma.dogma_remove_drone_partial(self, drone, count))
+        remaining = self._drones.get(drone, 0) - count
+        if remaining > 0:
+            self._drones[drone] = remaining
+        else:
+            self._drones.pop(drone, None)
 
     @sig(_, typeid_t)
     def remove_drone(self, drone):
+        self._touch()
         chk(libdogma.dogma_remove_drone(self, drone))
+        self._drones.pop(drone, None)
 
 
     @sig(_, Location, effectid_t, c_bool)
     def toggle_chance_based_effect(self, location, effect, on):
+        self._touch()
         chk(libdogma.dogma_toggle_chance_based_effect(
                 self, location, effect, on))
+        self._chance_effects[(location.key, effect)] = bool(on)
 
 
     @sig(_, Location, _)
     def target(self, location, targetee):
         """Add a target."""
+        chk(libdogma.dogma_target(self, location, targetee))
+        previous = self.targets_by_location.get(location)
         self.targets_by_location[location] = targetee
         targetee.targeters.add(self)
-        chk(libdogma.dogma_target(self, location, targetee))
+        self._linked = targetee._linked = True
+        if previous is not None:
+            self._untarget(previous)
+            touch_linked([self, previous])
+        else:
+            self._touch()
 
     @sig(_, Location)
     def clear_target(self, location):
-        targetee = self.targets_by_location[location]
-        targetee.targeters.remove(self)
+        self._touch()
         chk(libdogma.dogma_clear_target(self, location))
+        self._untarget(self.targets_by_location.pop(location))
+
+    def clear_all_targets(self):
+        """Clear every target of this context and every target on it."""
+        for location in list(self.targets_by_location.keys()):
+            self.clear_target(location)
+        for targeter in list(self.targeters):
+            for location, targetee in list(targeter.targets_by_location.items()):
+                if targetee is self:
+                    targeter.clear_target(location)
+
+    @contextmanager
+    def retargeting(self, locations):
+        """Point the modules at locations at one context after another,
+        without the bookkeeping of target(): yields a function taking
+        the next context to aim at.
+
+        Only libdogma's targets are switched, and targets_by_location and
+        targeters keep describing the original ones; on exit, every
+        location which was switched gets its original target back, even
+        if switching or reading failed half-way.
+        """
+        locations = [accept_or_cast(Location, location)
+                     for location in locations]
+        switched = []
+        # the last two contexts aimed at, whose attributes changed
+        aimed = []
+        def aim(targetee):
+            for location in locations:
+                chk(libdogma.dogma_target(self._as_parameter_, location,
+                                          targetee))
+                if not aimed or aimed[-1] is not targetee:
+                    aimed.append(targetee)
+                    del aimed[:-2]
+                if location not in switched:
+                    switched.append(location)
+                    original = self.targets_by_location.get(location)
+                    if original is not None:
+                        original._touch()
+            for context in aimed:
+                context._touch()
+        try:
+            yield aim
+        finally:
+            for location in switched:
+                original = self.targets_by_location.get(location)
+                if original is None:
+                    chk(libdogma.dogma_clear_target(self._as_parameter_,
+                                                    location))
+                else:
+                    chk(libdogma.dogma_target(self._as_parameter_, location,
+                                              original))
+                    original._touch()
+            for context in aimed:
+                context._touch()
+
+
+    def set_baseline(self):
+        """Record the current ship, modules, drones, implants (with their
+        chance-based effects) and skills as the state reset() returns to."""
+        self._baseline = (self._ship, dict(self._implants),
+                          dict((slot, tuple(module))
+                               for slot, module in self._modules.items()),
+                          dict(self._drones), self._default_skill_level,
+                          dict(self._skill_levels),
+                          dict(self._chance_effects))
+
+    def has_baseline(self):
+        """Whether set_baseline() has been called."""
+        return self._baseline is not None
+
+    def reset(self):
+        """Undo everything done since set_baseline() (or since creation),
+        and drop all targets and fleet membership.
+
+        Only the recorded differences are undone; the native context is
+        kept, which is much cheaper than freeing it and making a new one.
+        """
+        if self._baseline is None:
+            baseline = (0, {}, {}, {}, DEFAULT_SKILL_LEVEL, {}, {})
+        else:
+            baseline = self._baseline
+        (ship, implants, modules, drones, default_skill_level, skill_levels,
+         chance_effects) = baseline
+
+        if self._linked:
+            self.clear_all_targets()
+            fleet = self.fleet
+            if fleet is not None:
+                fleet.remove_fleet_member(self)
+
+        for slot, module in list(self._modules.items()):
+            if slot not in modules or modules[slot][0] != module[0]:
+                self.remove_module(slot)
+        for slot, implant in list(self._implants.items()):
+            if implants.get(slot) != implant:
+                self.remove_implant(slot)
+        for drone, count in list(self._drones.items()):
+            if drone not in drones:
+                self.remove_drone(drone)
+            elif count > drones[drone]:
+                self.remove_drone_partial(drone, count - drones[drone])
+
+        if self._skill_levels != skill_levels:
+            self.reset_skill_levels()
+            for skill, level in skill_levels.items():
+                self.set_skill_level(skill, level)
+        if self._default_skill_level != default_skill_level:
+            self.set_default_skill_level(default_skill_level)
+        if self._ship != ship:
+            self.set_ship(ship)
+
+        # Re-added slots usually come back at the same index, as libdogma
+        # hands out the lowest free key; the baseline follows if not.
+        for slot, implant in sorted(implants.items()):
+            if slot not in self._implants:
+                new_slot = self.add_implant(implant)
+                if new_slot != slot:
+                    del implants[slot]
+                    implants[new_slot] = implant
+                    old, new = Location.implant(slot).key, \
+                        Location.implant(new_slot).key
+                    for (location, effect), on in list(chance_effects.items()):
+                        if location == old:
+                            del chance_effects[(location, effect)]
+                            chance_effects[(new, effect)] = on
+        for key in set(self._chance_effects) | set(chance_effects):
+            on = chance_effects.get(key, False)
+            if self._chance_effects.get(key, False) != on:
+                (type, index), effect = key
+                self.toggle_chance_based_effect(intern_location(type, index),
+                                                effect, on)
+        for slot, (module, state, charge) in sorted(modules.items()):
+            current = self._modules.get(slot)
+            if current is not None and current[1] != state and state is None:
+                # Back to whatever state dogma_add_module leaves it in.
+                self.remove_module(slot)
+                current = None
+            if current is None:
+                new_slot = self.add_module(module, state, charge)
+                if new_slot != slot:
+                    del modules[slot]
+                    modules[new_slot] = (module, state, charge)
+                continue
+            if current[1] != state:
+                self.set_module_state(slot, state)
+            if current[2] != charge:
+                if charge is None:
+                    self.remove_charge(slot)
+                else:
+                    self.add_charge(slot, charge)
+        for drone, count in drones.items():
+            missing = count - self._drones.get(drone, 0)
+            if missing > 0:
+                self.add_drone(drone, missing)
+
+    def _untarget(self, targetee):
+        if targetee not in self.targets_by_location.values():
+            targetee.targeters.discard(self)
 
 
     @sig(_, Location, attributeid_t)
     def get_location_attribute(self, location, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(location, attribute)
         result = c_double()
         chk(libdogma.dogma_get_location_attribute(
                 self, location, attribute, byref(result)))
@@ -305,6 +1429,8 @@ class Context(object):
 
     @sig(_, attributeid_t)
     def get_character_attribute(self, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.char(), attribute)
         result = c_double()
         chk(libdogma.dogma_get_character_attribute(
                 self, attribute, byref(result)))
@@ -312,6 +1438,8 @@ class Context(object):
 
     @sig(_, key_t, attributeid_t)
     def get_implant_attribute(self, implant, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.implant(implant), attribute)
         result = c_double()
         chk(libdogma.dogma_get_implant_attribute(
                 self, implant, attribute, byref(result)))
@@ -319,6 +1447,8 @@ class Context(object):
 
     @sig(_, typeid_t, attributeid_t)
     def get_skill_attribute(self, skill, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.skill(skill), attribute)
         result = c_double()
         chk(libdogma.dogma_get_skill_attribute(
                 self, skill, attribute, byref(result)))
@@ -326,12 +1456,16 @@ class Context(object):
 
     @sig(_, attributeid_t)
     def get_ship_attribute(self, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.ship(), attribute)
         result = c_double()
         chk(libdogma.dogma_get_ship_attribute(self, attribute, byref(result)))
         return result.value
 
     @sig(_, key_t, attributeid_t)
     def get_module_attribute(self, module, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.module(module), attribute)
         result = c_double()
         chk(libdogma.dogma_get_module_attribute(
                 self, module, attribute, byref(result)))
@@ -339,6 +1473,8 @@ class Context(object):
 
     @sig(_, key_t, attributeid_t)
     def get_charge_attribute(self, charge, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.charge(charge), attribute)
         result = c_double()
         chk(libdogma.dogma_get_charge_attribute(
                 self, charge, attribute, byref(result)))
@@ -346,12 +1482,234 @@ class Context(object):
 
     @sig(_, typeid_t, attributeid_t)
     def get_drone_attribute(self, drone, attribute):
+        if self._attribute_cache is not None:
+            return self._cached_attribute(Location.drone(drone), attribute)
         result = c_double()
         chk(libdogma.dogma_get_drone_attribute(
                 self, drone, attribute, byref(result)))
         return result.value
 
 
+    def get_attributes(self, locations, attributes, out=None, status=None):
+        """Get many attributes in a single pass.
+
+        Returns a pair (values, status) of flat, row-major sequences with one
+        cell per (location, attribute) pair. Instead of raising, the status of
+        each cell is recorded as OK, NOT_FOUND or NOT_APPLICABLE; the value of
+        a failed cell is nan. Preallocated buffers (array('d') and array('b'),
+        or NumPy arrays) may be passed as out and status.
+        """
+        attributes = list(attributes)
+        pairs = [(location, attribute)
+                 for location in locations for attribute in attributes]
+        return self.get_location_attributes(pairs, out, status)
+
+    def get_location_attributes(self, pairs, out=None, status=None, offset=0):
+        """Like get_attributes, for an arbitrary sequence of (location,
+        attribute) pairs. Cells are written to out and status from offset
+        on; a location of None is reported as NOT_FOUND."""
+        size = offset + len(pairs)
+        if out is None:
+            out = array('d', [0.0]) * size
+        if status is None:
+            status = array('b', [OK]) * size
+        if len(out) < size or len(status) < size:
+            raise ValueError("buffer too small for %d values" % size)
+
+        nan = float('nan')
+        i = offset
+        if self._attribute_cache is not None:
+            for location, attribute in pairs:
+                if location is None:
+                    out[i] = nan
+                    status[i] = NOT_FOUND
+                    i += 1
+                    continue
+                try:
+                    out[i] = self._cached_attribute(
+                        accept_or_cast(Location, location), attribute)
+                    status[i] = OK
+                except NotFoundException:
+                    out[i] = nan
+                    status[i] = NOT_FOUND
+                except NotApplicableException:
+                    out[i] = nan
+                    status[i] = NOT_APPLICABLE
+                i += 1
+            return out, status
+
+        get = bare_function('dogma_get_location_attribute')
+        context = self._as_parameter_
+        result = c_double()
+        result_ref = byref(result)
+        attribute_ids = {}
+        for location, attribute in pairs:
+            if location is None:
+                out[i] = nan
+                status[i] = NOT_FOUND
+                i += 1
+                continue
+            location = accept_or_cast(Location, location)
+            attribute_id = attribute_ids.get(attribute)
+            if attribute_id is None:
+                attribute_id = attribute_ids[attribute] = attributeid_t(attribute)
+            ret = get(context, location, attribute_id, result_ref)
+            if ret == OK:
+                out[i] = result.value
+            else:
+                if ret not in (NOT_FOUND, NOT_APPLICABLE):
+                    chk(ret)
+                out[i] = nan
+            status[i] = ret
+            i += 1
+        return out, status
+
+    def evaluate_candidates(self, slot, candidates, attributes, state=None,
+                            charge=None):
+        """Try each candidate module in slot and read attributes for it.
+
+        attributes is a sequence of (location, attribute) pairs; a location
+        of None stands for the candidate module itself. Returns (values,
+        status, slot) where values and status are flat candidates x
+        attributes arrays as for get_attributes. Candidates libdogma
+        refuses to fit have their whole row marked with the error status.
+
+        The module originally in slot (if any) is added back at the end,
+        targeting what it targeted before; libdogma gives it back the same
+        slot unless a lower one is free, and the slot it ended up in is
+        returned.
+        """
+        attributes = list(attributes)
+        width = len(attributes)
+        size = len(candidates) * width
+        values = array('d', [float('nan')]) * size
+        status = array('b', [OK]) * size
+
+        original = self._modules.get(slot)
+        targetee = None
+        if original is not None:
+            location = Location.module(slot)
+            targetee = self.targets_by_location.get(location)
+            if targetee is not None:
+                self.clear_target(location)
+            self.remove_module(slot)
+        try:
+            for row, candidate in enumerate(candidates):
+                try:
+                    candidate_slot = self.add_module(candidate, state, charge)
+                except DogmaException as e:
+                    code = (NOT_APPLICABLE
+                            if isinstance(e, NotApplicableException)
+                            else NOT_FOUND)
+                    for i in range(row * width, (row + 1) * width):
+                        status[i] = code
+                    continue
+                module = Location.module(candidate_slot)
+                pairs = [(module if location is None else location, attribute)
+                         for location, attribute in attributes]
+                try:
+                    self.get_location_attributes(pairs, values, status,
+                                                 row * width)
+                finally:
+                    self.remove_module(candidate_slot)
+        finally:
+            if original is not None:
+                slot = self.add_module(*original)
+                if targetee is not None:
+                    self.target(Location.module(slot), targetee)
+        return values, status, slot
+
+    def skill_sweep(self, skill_typeids, attribute_locations):
+        """Read attributes with each skill in turn trained to every level
+        from 0 to 5, the other skills staying as they are.
+
+        attribute_locations is a sequence of (location, attribute) pairs.
+        Returns (values, status) as for get_attributes, flat skills x 6
+        levels x attributes arrays. Skills which do not show up among the
+        affectors of any of the requested attributes, or of the ship,
+        modules and charges affecting them, are not touched: their rows
+        repeat the current values. The original skill levels are
+        restored afterwards.
+        """
+        pairs = list(attribute_locations)
+        skills = list(skill_typeids)
+        width = len(pairs)
+        levels = range(MAX_SKILL_LEVEL + 1)
+        size = len(skills) * len(levels) * width
+        values = array('d', [0.0]) * size
+        status = array('b', [OK]) * size
+
+        current, current_status = self.get_location_attributes(pairs)
+        relevant = self._affecting_types(pairs)
+        original = dict(self._skill_levels)
+        for row, skill in enumerate(skills):
+            level_now = original.get(skill, self._default_skill_level)
+            swept = False
+            try:
+                for level in levels:
+                    offset = (row * len(levels) + level) * width
+                    if skill not in relevant or level == level_now:
+                        values[offset:offset + width] = current
+                        status[offset:offset + width] = current_status
+                        continue
+                    swept = True
+                    self._touch()
+                    chk(libdogma.dogma_set_skill_level(self._as_parameter_,
+                                                       skill, level))
+                    self._skill_levels[skill] = level
+                    self.get_location_attributes(pairs, values, status, offset)
+            finally:
+                # back to level_now before the next row is swept
+                if swept:
+                    self._restore_skill_level(skill, original)
+        return values, status
+
+    def _restore_skill_level(self, skill, original):
+        """Put skill back as it is in original, a copy of _skill_levels."""
+        if skill in original:
+            self.set_skill_level(skill, original[skill])
+        else:
+            # libdogma cannot unset a single skill level
+            self.reset_skill_levels()
+            for other, level in original.items():
+                self.set_skill_level(other, level)
+
+    def _affecting_types(self, pairs):
+        """The typeids of everything modifying the attributes in pairs,
+        directly or through the ship, modules and charges which do."""
+        sources = {}
+        if self._ship:
+            sources[self._ship] = [Location.ship()]
+        for slot, (module, state, charge) in self._modules.items():
+            sources.setdefault(module, []).append(Location.module(slot))
+            if charge is not None:
+                sources.setdefault(charge, []).append(Location.charge(slot))
+
+        wanted = {}
+        for location, attribute in pairs:
+            if location is not None:
+                wanted.setdefault(accept_or_cast(Location, location),
+                                  set()).add(attribute)
+        # (location, attributes of interest or None for all of them)
+        pending = list(wanted.items())
+        expanded = set()
+        typeids = set()
+        while pending:
+            location, attributes = pending.pop()
+            try:
+                affectors = self.get_affectors(location)
+            except DogmaException:
+                continue
+            for affector in affectors:
+                if attributes is not None and affector.destid not in attributes:
+                    continue
+                typeids.add(affector.id)
+                for source in sources.get(affector.id, ()):
+                    if source not in expanded:
+                        expanded.add(source)
+                        pending.append((source, None))
+        return typeids
+
     @sig(_, Location, effectid_t)
     def get_chance_based_effect_chance(self, location, effect):
         result = c_double()
@@ -359,6 +1717,138 @@ class Context(object):
                 self, location, effect, byref(result)))
         return result.value
 
+    def chance_based_effects(self):
+        """The chance-based effects (booster side effects) of the
+        implants, as a list of (location, effect, chance) in slot order."""
+        effects = []
+        for slot, implant in sorted(self._implants.items()):
+            location = Location.implant(slot)
+            for effect in type_effects_with_attributes(implant):
+                try:
+                    chance = self.get_chance_based_effect_chance(location,
+                                                                 effect)
+                except NotFoundException:
+                    continue
+                effects.append((location, effect, chance))
+        return effects
+
+    def side_effect_distribution(self, attribute_locations, samples=None,
+                                 effects=None, rng=None):
+        """Read attributes under the combinations of chance-based effects
+        and how likely each combination is.
+
+        attribute_locations is a sequence of (location, attribute) pairs;
+        effects is a list of (location, effect, chance) as returned by
+        chance_based_effects(), which is used by default. With up to
+        MAX_EXACT_SIDE_EFFECTS effects every combination is evaluated and
+        weighted by its exact probability; with more, samples combinations
+        (DEFAULT_SIDE_EFFECT_SAMPLES by default) are drawn from rng (a
+        random.Random, the random module by default) and each distinct one is
+        weighted by how often it came up.
+
+        Returns (combinations, weights, values, status): combinations is a
+        list of bit masks, bit i being set when the ith effect is on,
+        weights the matching array('d') of probabilities, and values and
+        status are flat combinations x attributes arrays as for
+        get_attributes. The effects are put back as they were afterwards.
+        Values are kept per combination until the context changes, so
+        asking again (for the same or other attributes) only reads what
+        was not read before.
+        """
+        pairs = list(attribute_locations)
+        if effects is None:
+            effects = self.chance_based_effects()
+        effects = [(accept_or_cast(Location, location), effect, chance)
+                   for location, effect, chance in effects]
+
+        if len(effects) <= MAX_EXACT_SIDE_EFFECTS:
+            combinations = list(range(1 << len(effects)))
+            weights = array('d', [1.0]) * len(combinations)
+            for i, (location, effect, chance) in enumerate(effects):
+                for mask in combinations:
+                    weights[mask] *= chance if mask >> i & 1 else 1.0 - chance
+            # Gray code order: one toggle from each combination to the next
+            order = [k ^ (k >> 1) for k in combinations]
+        else:
+            if rng is None:
+                rng = random
+            if samples is None:
+                samples = DEFAULT_SIDE_EFFECT_SAMPLES
+            counts = {}
+            for _ in range(samples):
+                mask = 0
+                for i, (location, effect, chance) in enumerate(effects):
+                    if rng.random() < chance:
+                        mask |= 1 << i
+                counts[mask] = counts.get(mask, 0) + 1
+            combinations = sorted(counts)
+            weights = array('d', [counts[mask] / float(samples)
+                                  for mask in combinations])
+            order = combinations
+
+        width = len(pairs)
+        keys = [(None if location is None
+                 else accept_or_cast(Location, location).key, attribute)
+                for location, attribute in pairs]
+        cached = self._side_effects_cached(effects)
+        original = 0
+        for i, (location, effect, chance) in enumerate(effects):
+            if self._chance_effects.get((location.key, effect)):
+                original |= 1 << i
+
+        toggle = libdogma.dogma_toggle_chance_based_effect
+        current = original
+        try:
+            for mask in order:
+                known = cached.setdefault(mask, {})
+                missing = [(pair, key) for pair, key in zip(pairs, keys)
+                           if key not in known]
+                if not missing:
+                    continue
+                changed = current ^ mask
+                if changed:
+                    self._touch()
+                for i, (location, effect, chance) in enumerate(effects):
+                    if changed >> i & 1:
+                        chk(toggle(self._as_parameter_, location, effect,
+                                   bool(mask >> i & 1)))
+                        current ^= 1 << i
+                read, read_status = self.get_location_attributes(
+                    [pair for pair, key in missing])
+                for (pair, key), value, code in zip(missing, read,
+                                                    read_status):
+                    known[key] = (value, code)
+        finally:
+            if current != original:
+                self._touch()
+                for i, (location, effect, chance) in enumerate(effects):
+                    if (current ^ original) >> i & 1:
+                        chk(toggle(self._as_parameter_, location, effect,
+                                   bool(original >> i & 1)))
+            self._side_effect_cache = (self._generation,) + \
+                self._side_effect_cache[1:]
+
+        size = len(combinations) * width
+        values = array('d', [0.0]) * size
+        status = array('b', [OK]) * size
+        i = 0
+        for mask in combinations:
+            known = cached[mask]
+            for key in keys:
+                values[i], status[i] = known[key]
+                i += 1
+        return combinations, weights, values, status
+
+    def _side_effects_cached(self, effects):
+        """The per-combination attribute values kept for effects, valid
+        as long as the context is unchanged."""
+        key = tuple((location.key, effect) for location, effect, chance
+                    in effects)
+        cache = self._side_effect_cache
+        if cache is None or cache[0] != self._generation or cache[1] != key:
+            cache = self._side_effect_cache = (self._generation, key, {})
+        return cache[2]
+
 
     @sig(_, Location)
     def get_affectors(self, location):
@@ -366,9 +1856,7 @@ class Context(object):
         size = c_size_t()
         chk(libdogma.dogma_get_affectors(
                 self, location, byref(affectors), byref(size)))
-        result = [affectors[i].copy() for i in range(size.value)]
-        libdogma.dogma_free_affector_list(affectors)
-        return affectors
+        return AffectorList(affectors, size.value)
 
     @sig(_, key_t)
     def get_number_of_module_cycles_before_reload(self, slot):
@@ -384,22 +1872,7 @@ class Context(object):
 
         chk(libdogma.dogma_get_capacitor_all(
                 self, include_reload_time, byref(capacitors), byref(size)))
-        capacitors_by_context = {}
-        relevant_contexts = self.targeters.union(set(self.targets_by_location))
-        relevant_contexts.add(self)
-        assert len(relevant_contexts) == size.value
-        for i in range(size.value):
-            found = False
-            for context in relevant_contexts:
-                if (addressof(context._as_parameter_.contents) ==
-                    addressof(capacitors[i].context.contents)):
-                    assert not found
-                    found = True
-                    capacitors_by_context[context] = capacitors[i].copy()
-            assert found
-        libdogma.dogma_free_capacitor_list(capacitors)
-
-        return capacitors_by_context
+        return CapacitorList(capacitors, size.value)
 
     @sig(_, Location, effectid_t)
     def get_location_effect_attributes(self, location, effect):
@@ -416,86 +1889,620 @@ class Context(object):
         return (duration.value, trackingspeed.value, discharge.value,
                 range.value, falloff.value, fittingusagechance.value)
 
+    def get_all_effect_attributes(self):
+        """get_location_effect_attributes for every effect with attributes
+        of every module, charge and drone, in one EffectAttributesList.
+
+        Rows come in slot order (each module followed by its charge), then
+        drones by typeid. The effects of each type are looked up once and
+        cached (see type_effects_with_attributes); an effect libdogma has
+        no attributes for at its location gets a row of nan.
+        """
+        rows = []
+        for slot, (module, state, charge) in sorted(self._modules.items()):
+            rows.append((Location.module(slot), module))
+            if charge is not None:
+                rows.append((Location.charge(slot), charge))
+        for drone in sorted(self._drones):
+            rows.append((Location.drone(drone), drone))
+        rows = [(location, typeid, effect) for location, typeid in rows
+                for effect in type_effects_with_attributes(typeid)]
+
+        result = EffectAttributesList(len(rows))
+        get = bare_function('dogma_get_location_effect_attributes')
+        context = self._as_parameter_
+        outputs = [c_double() for _ in range(6)]
+        refs = [byref(output) for output in outputs]
+        fields = ['duration', 'tracking', 'discharge', 'range', 'falloff',
+                  'usage_chance']
+        nan = float('nan')
+        effect_ids = {}
+        for row, (location, typeid, effect) in zip(result.array, rows):
+            row.location_type, row.location_index = location.key
+            row.typeid = typeid
+            row.effect = effect
+            effect_id = effect_ids.get(effect)
+            if effect_id is None:
+                effect_id = effect_ids[effect] = effectid_t(effect)
+            ret = get(context, location, effect_id, *refs)
+            if ret == OK:
+                for field, output in zip(fields, outputs):
+                    setattr(row, field, output.value)
+            else:
+                if ret not in (NOT_FOUND, NOT_APPLICABLE):
+                    chk(ret)
+                for field in fields:
+                    setattr(row, field, nan)
+        return result
+
+
+FLEET_COMMANDER = 'fleet_commander'
+WING_COMMANDER = 'wing_commander'
+SQUAD_COMMANDER = 'squad_commander'
+SQUAD_MEMBER = 'squad_member'
+
+def _tree_items(entries):
+    if isinstance(entries, Mapping):
+        return entries.items()
+    return enumerate(entries)
+
+def tree_positions(tree):
+    """Flatten a fleet tree into ({member: position}, {level: booster}).
+
+    A tree is a mapping with the optional keys 'commander', 'booster'
+    and 'wings'; wings (a mapping of wing id to wing, or a list) and
+    squads likewise have 'commander', 'booster' and 'squads' or
+    'members'. Positions are (role, wing, squad) tuples and levels are
+    (wing, squad) tuples, None standing for the fleet or wing level.
+    """
+    positions = {}
+    boosters = {}
+    def place(member, position):
+        if member is None:
+            return
+        if member in positions:
+            raise ValueError("member in two positions: %r and %r"
+                             % (positions[member], position))
+        positions[member] = position
+    place(tree.get('commander'), (FLEET_COMMANDER, None, None))
+    boosters[(None, None)] = tree.get('booster')
+    for wing_id, wing in _tree_items(tree.get('wings', ())):
+        place(wing.get('commander'), (WING_COMMANDER, wing_id, None))
+        boosters[(wing_id, None)] = wing.get('booster')
+        for squad_id, squad in _tree_items(wing.get('squads', ())):
+            place(squad.get('commander'),
+                  (SQUAD_COMMANDER, wing_id, squad_id))
+            boosters[(wing_id, squad_id)] = squad.get('booster')
+            for member in squad.get('members', ()):
+                place(member, (SQUAD_MEMBER, wing_id, squad_id))
+    return positions, dict((level, booster)
+                           for level, booster in boosters.items()
+                           if booster is not None)
 
-fleet_context_t = POINTER(c_void_p)
 class FleetContext(object):
     def __init__(self):
         self._as_parameter_ = fleet_context_t()
+        self.members = weakref.WeakSet()
+        # Python-side index of where everyone is, kept by every method
+        self.positions = weakref.WeakKeyDictionary()
+        self.boosters = {}
         chk(libdogma.dogma_init_fleet_context(byref(self._as_parameter_)))
 
     def __del__(self):
+        if not getattr(self, '_as_parameter_', None):
+            return
+        # libdogma drops the boosts of all members
+        touch_linked(self.members)
         chk(libdogma.dogma_free_fleet_context(self))
 
+    def _record(self, member, position):
+        """Index member at position; returns the fleet it left, if any."""
+        previous = member.fleet
+        if previous is not self:
+            if previous is not None:
+                previous._forget(member)
+            self.members.add(member)
+            member._fleet = weakref.ref(self)
+            member._linked = True
+        self.positions[member] = position
+        return previous if previous is not self else None
+
+    def _forget(self, member):
+        self.members.discard(member)
+        self.positions.pop(member, None)
+        for level, booster in list(self.boosters.items()):
+            if booster() is member:
+                del self.boosters[level]
+        if member.fleet is self:
+            member._fleet = None
+
+    def _join(self, member, position):
+        previous = member.fleet
+        if previous is not None and previous is not self:
+            touch_linked([member])
+        self._record(member, position)
+        touch_linked([member])
+
+    def _touch(self):
+        touch_linked(self.members)
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Build a fleet from a tree as described in tree_positions."""
+        fleet = cls()
+        fleet.apply_tree(tree)
+        return fleet
+
+    def position(self, member):
+        """The (role, wing, squad) of member in this fleet, or None."""
+        return self.positions.get(member)
+
+    def booster(self, wing=None, squad=None):
+        """The booster of the fleet, of a wing or of a squad, or None."""
+        booster = self.boosters.get((wing, squad))
+        return booster() if booster is not None else None
+
+    def get_tree(self):
+        """Describe the fleet in the form apply_tree takes, with wings and
+        squads as mappings."""
+        tree = {'wings': {}}
+        def level(wing, squad):
+            if wing is None:
+                return tree
+            wing_tree = tree['wings'].setdefault(wing, {'squads': {}})
+            if squad is None:
+                return wing_tree
+            return wing_tree['squads'].setdefault(squad, {'members': []})
+        for member, (role, wing, squad) in sorted(
+                self.positions.items(), key=lambda item: id(item[0])):
+            if role == SQUAD_MEMBER:
+                level(wing, squad)['members'].append(member)
+            else:
+                level(wing, squad)['commander'] = member
+        for (wing, squad), booster in self.boosters.items():
+            if booster() is not None:
+                level(wing, squad)['booster'] = booster()
+        return tree
+
+    def apply_tree(self, tree):
+        """Make the fleet match tree (see tree_positions) in one call.
+
+        Members which are already where the tree puts them are left
+        alone; the others are removed, moved or added, and boosters are
+        set only where they change.
+        """
+        positions, boosters = tree_positions(tree)
+        fleet = self._as_parameter_
+        for level, booster in list(self.boosters.items()):
+            if booster() is None:
+                # collected, and so gone from the fleet in libdogma too
+                del self.boosters[level]
+        found = c_bool()
+        touched = set(self.members)
+        moved = set()
+        left = set()
+
+        try:
+            for member, position in list(self.positions.items()):
+                if positions.get(member) != position:
+                    chk(libdogma.dogma_remove_fleet_member(fleet, member,
+                                                           byref(found)))
+                    self._forget(member)
+                    moved.add(member)
+
+            for member, position in positions.items():
+                if self.positions.get(member) == position:
+                    continue
+                role, wing, squad = position
+                if role == FLEET_COMMANDER:
+                    chk(libdogma.dogma_add_fleet_commander(fleet, member))
+                elif role == WING_COMMANDER:
+                    chk(libdogma.dogma_add_wing_commander(fleet, wing, member))
+                elif role == SQUAD_COMMANDER:
+                    chk(libdogma.dogma_add_squad_commander(fleet, wing, squad,
+                                                           member))
+                else:
+                    chk(libdogma.dogma_add_squad_member(fleet, wing, squad,
+                                                        member))
+                previous = self._record(member, position)
+                if previous is not None:
+                    left.add(previous)
+                moved.add(member)
+                touched.add(member)
+
+            for level in set(self.boosters) | set(boosters):
+                wanted = boosters.get(level)
+                if self.booster(*level) is wanted and wanted not in moved:
+                    continue
+                self._set_booster(level, wanted)
+        finally:
+            # also when one of the calls above failed half-way
+            for previous in left:
+                touched.update(previous.members)
+            touch_linked(touched)
+
+    def _set_booster(self, level, booster):
+        wing, squad = level
+        fleet = self._as_parameter_
+        try:
+            if wing is None:
+                chk(libdogma.dogma_set_fleet_booster(fleet, booster))
+            elif squad is None:
+                chk(libdogma.dogma_set_wing_booster(fleet, wing, booster))
+            else:
+                chk(libdogma.dogma_set_squad_booster(fleet, wing, squad,
+                                                     booster))
+        except NotFoundException:
+            # unsetting the booster of a wing or squad which is gone
+            if booster is not None:
+                raise
+        self._booster_set(level, booster)
+
+    def _booster_set(self, level, booster):
+        if booster is None:
+            self.boosters.pop(level, None)
+        else:
+            self.boosters[level] = weakref.ref(booster)
+
 
     @sig(_, Context)
     def add_fleet_commander(self, commander):
         chk(libdogma.dogma_add_fleet_commander(self, commander))
+        self._join(commander, (FLEET_COMMANDER, None, None))
 
     @sig(_, key_t, Context)
     def add_wing_commander(self, wing, commander):
         chk(libdogma.dogma_add_wing_commander(self, wing, commander))
+        self._join(commander, (WING_COMMANDER, wing, None))
 
     @sig(_, key_t, key_t, Context)
     def add_squad_commander(self, wing, squad, commander):
         chk(libdogma.dogma_add_squad_commander(self, wing, squad, commander))
+        self._join(commander, (SQUAD_COMMANDER, wing, squad))
 
     @sig(_, key_t, key_t, Context)
     def add_squad_member(self, wing, squad, member):
         chk(libdogma.dogma_add_squad_member(self, wing, squad, member))
+        self._join(member, (SQUAD_MEMBER, wing, squad))
 
 
     @sig(_, Context)
     def remove_fleet_member(self, member):
+        self._touch()
         found = c_bool()
         chk(libdogma.dogma_remove_fleet_member(self, member, byref(found)))
+        if member.fleet is self:
+            self._forget(member)
         return found
 
 
     @sig(_, Context)
     def set_fleet_booster(self, booster):
+        self._touch()
         chk(libdogma.dogma_set_fleet_booster(self, booster))
+        self._booster_set((None, None), booster)
 
     @sig(_, key_t, Context)
     def set_wing_booster(self, wing, booster):
+        self._touch()
         chk(libdogma.dogma_set_wing_booster(self, wing, booster))
+        self._booster_set((wing, None), booster)
 
     @sig(_, key_t, key_t, Context)
     def set_squad_booster(self, wing, squad, booster):
+        self._touch()
         chk(libdogma.dogma_set_squad_booster(self, wing, squad, booster))
+        self._booster_set((wing, squad), booster)
+
+
+class ContextPool(object):
+    """A free list of Contexts which are reset on checkin instead of being
+    freed and reallocated.
+
+    setup, if given, is called on every new context; whatever it fits
+    becomes the baseline that checked-in contexts are reset to.
+    """
+    def __init__(self, maxsize=None, setup=None):
+        self.maxsize = maxsize
+        self.setup = setup
+        self.free = []
+
+    def checkout(self):
+        if self.free:
+            return self.free.pop()
+        context = Context()
+        if self.setup is not None:
+            self.setup(context)
+        context.set_baseline()
+        return context
+
+    def checkin(self, context):
+        try:
+            context.reset()
+        except DogmaException:
+            # Drop it rather than hand out a context in an unknown state.
+            return
+        if self.maxsize is None or len(self.free) < self.maxsize:
+            self.free.append(context)
+
+    @contextmanager
+    def context(self):
+        """Check out a context for the duration of a with block."""
+        context = self.checkout()
+        try:
+            yield context
+        finally:
+            self.checkin(context)
+
+
+# The type_* queries only read libdogma's static data, so their results
+# (including NotFound/NotApplicable) are kept in bounded LRU caches; see
+# cache_info() and cache_clear() on each of them.
+
+TYPE_CACHE_SIZE = 16384
+
+def memoize(maxsize):
+    def wrap(f):
+        cache = LRUCache(maxsize)
+        missing = object()
+        def new_f(*args):
+            try:
+                result = cache.get(args, missing)
+            except TypeError:
+                # unhashable (ctypes) arguments
+                return f(*args)
+            if result is missing:
+                try:
+                    result = (True, f(*args))
+                except DogmaException as e:
+                    result = (False, type(e))
+                cache.put(args, result)
+            ok, value = result
+            if not ok:
+                raise value
+            return value
+        new_f.__name__ = f.__name__
+        new_f.__doc__ = f.__doc__
+        new_f.cache_info = cache.info
+        new_f.cache_clear = cache.clear
+        return new_f
+    return wrap
 
-
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t, state_t, effectid_t)
 def type_has_effect(typ, state, effect):
     result = c_bool()
     chk(libdogma.dogma_type_has_effect(typ, state, effect, byref(result)))
     return result.value
 
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t)
 def type_has_active_effects(typ):
     result = c_bool()
     chk(libdogma.dogma_type_has_active_effects(typ, byref(result)))
     return result.value
 
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t)
 def type_has_overload_effects(typ):
     result = c_bool()
     chk(libdogma.dogma_type_has_overload_effects(typ, byref(result)))
     return result.value
 
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t)
 def type_has_projectable_effects(typ):
     result = c_bool()
     chk(libdogma.dogma_type_has_projectable_effects(typ, byref(result)))
     return result.value
 
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t, attributeid_t)
 def type_base_attribute(typ, attribute):
     result = c_double()
     chk(libdogma.dogma_type_base_attribute(typ, attribute, byref(result)))
     return result.value
 
+@memoize(TYPE_CACHE_SIZE)
 @sig(typeid_t, c_uint)
 def get_nth_type_effect_with_attributes(typ, n):
     result = effectid_t()
     chk(libdogma.dogma_get_nth_type_effect_with_attributes(typ, n, byref(result)))
     return result.value
+
+@memoize(TYPE_CACHE_SIZE)
+def type_effects_with_attributes(typ):
+    """All effects of typ which have attributes, as a tuple."""
+    effects = []
+    while True:
+        try:
+            effects.append(get_nth_type_effect_with_attributes(typ, len(effects)))
+        except NotFoundException:
+            return tuple(effects)
+
+
+# profiling
+#
+# enable_profiling() (or DOGMA_PROFILE=1 in the environment at import)
+# replaces every libdogma.dogma_* function and every public Context and
+# FleetContext method with a timing wrapper; disable_profiling() puts the
+# originals back, so nothing is wrapped unless profiling is on. The
+# libdogma functions are only wrapped once the library is loaded, so
+# profiling does not load it early.
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+class SymbolStats(object):
+    """Counters for one profiled symbol. Latencies of the last samples
+    calls are kept for percentiles."""
+    def __init__(self, native, samples):
+        self.native = native
+        self.latencies = deque(maxlen=samples)
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.latencies.clear()
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))]
+
+    def snapshot(self):
+        return {'native': self.native,
+                'calls': self.calls,
+                'errors': self.errors,
+                'total': self.total,
+                'own': self.own,
+                'mean': self.total / self.calls if self.calls else None,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': max(self.latencies) if self.latencies else None}
+
+class Profile(object):
+    def __init__(self, samples):
+        self.samples = samples
+        self.symbols = {}
+        self.originals = []
+        self.local = threading.local()
+
+    def symbol(self, name, native):
+        stats = self.symbols.get(name)
+        if stats is None:
+            stats = self.symbols[name] = SymbolStats(native, self.samples)
+        return stats
+
+    def wrap(self, name, f, native):
+        """Time f under name. Native calls count a non-OK return code as an
+        error, methods any exception; time spent in nested profiled calls
+        is subtracted from own time."""
+        stats = self.symbol(name, native)
+        local = self.local
+        def profiled(*args, **kwargs):
+            try:
+                stack = local.stack
+            except AttributeError:
+                stack = local.stack = []
+            stack.append(0.0)
+            error = True
+            start = _timer()
+            try:
+                result = f(*args, **kwargs)
+                error = native and result != OK
+                return result
+            finally:
+                elapsed = _timer() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                stats.calls += 1
+                stats.errors += error
+                stats.total += elapsed
+                stats.own += elapsed - children
+                stats.latencies.append(elapsed)
+        profiled.__name__ = getattr(f, '__name__', name)
+        profiled.__doc__ = getattr(f, '__doc__', None)
+        return profiled
+
+    def install(self):
+        for cls in (Context, FleetContext):
+            for attribute, value in sorted(vars(cls).items()):
+                if (isinstance(value, FunctionType) and
+                    (attribute == '__init__' or not attribute.startswith('_'))):
+                    self.replace(cls, attribute,
+                                 '%s.%s' % (cls.__name__, attribute), False)
+        # otherwise init() does this once it has loaded the library
+        if not isinstance(libdogma, LazyLibrary):
+            self.install_native(libdogma)
+
+    def install_native(self, lib):
+        for name in sorted(_prototypes):
+            self.replace(lib, name, name, True)
+
+    def replace(self, owner, attribute, name, native):
+        original = getattr(owner, attribute)
+        if native:
+            wrapped = self.wrap(name, original, True)
+        else:
+            original = vars(owner)[attribute]
+            wrapped = self.wrap(name, original, False)
+        self.originals.append((owner, attribute, original))
+        setattr(owner, attribute, wrapped)
+
+    def uninstall(self):
+        while self.originals:
+            owner, attribute, original = self.originals.pop()
+            setattr(owner, attribute, original)
+
+class ProfileStats(object):
+    """Adapter handing the counters to pstats.Stats, which calls
+    create_stats() and takes the resulting stats dict."""
+    def __init__(self, profile):
+        self.profile = profile
+
+    def create_stats(self):
+        self.stats = {}
+        for name, stats in self.profile.symbols.items():
+            if not stats.calls:
+                continue
+            filename = 'libdogma' if stats.native else __name__
+            self.stats[(filename, 0, name)] = (stats.calls, stats.calls,
+                                               stats.own, stats.total, {})
+
+_profile = None
+
+def enable_profiling(samples=4096):
+    """Start recording call counts, latencies and errors for libdogma
+    functions and Context/FleetContext methods."""
+    global _profile
+    if _profile is None:
+        _profile = Profile(samples)
+    if not _profile.originals:
+        _profile.install()
+
+def disable_profiling():
+    """Remove the timing wrappers; recorded statistics are kept."""
+    if _profile is not None:
+        _profile.uninstall()
+
+def profiling_enabled():
+    return _profile is not None and bool(_profile.originals)
+
+def reset_profiling():
+    if _profile is not None:
+        for stats in _profile.symbols.values():
+            stats.clear()
+
+def profiling_snapshot():
+    """{symbol: {'calls', 'errors', 'total', 'own', 'mean', 'p50', 'p90',
+    'p99', 'max'}} with times in seconds, for the symbols called so far."""
+    if _profile is None:
+        return {}
+    return dict((name, stats.snapshot())
+                for name, stats in _profile.symbols.items() if stats.calls)
+
+def profiling_stats():
+    """The statistics as a pstats.Stats, e.g. for print_stats() or
+    dump_stats() to a file for cProfile viewers."""
+    import pstats
+    if _profile is not None and any(stats.calls
+                                    for stats in _profile.symbols.values()):
+        return pstats.Stats(ProfileStats(_profile))
+    try:
+        return pstats.Stats()
+    except TypeError:
+        # Python 2's Stats refuses to start out empty
+        class EmptyStats(pstats.Stats):
+            def load_stats(self, arg):
+                self.stats = {}
+        return EmptyStats()
+
+if os.environ.get('DOGMA_PROFILE', '').strip().lower() not in (
+        '', '0', 'false', 'no', 'off'):
+    enable_profiling()
@@ -0,0 +1,166 @@
+"""asyncio front-end running libdogma work on a bounded thread pool.
+
+ctypes releases the GIL around libdogma calls, so contexts which have
+nothing to do with each other are evaluated concurrently. A context is
+not safe to use from two threads at once, though, and neither are
+contexts linked to it through targets or a fleet (evaluating one reads
+the others), so every call locks the wrapped object and everything
+linked to it, as found at call time, and calls on linked objects run
+one at a time. Links made through the plain Context and FleetContext
+API, or before wrapping, count just the same.
+
+    ctx = AsyncContext()
+    values, status = await ctx.evaluate_fit(fit, attributes)
+    capacitors = await ctx.get_capacitor_all(False)
+    results = await ctx.evaluate_fits(fits, attributes)
+    slot = await ctx.run(lambda context: context.add_module(module))
+
+Requires Python 3.5 or later.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import os
+import weakref
+
+import dogma
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+_executor = None
+
+def default_executor():
+    """The thread pool shared by wrappers created without an executor."""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(DEFAULT_WORKERS)
+    return _executor
+
+
+# dogma.Context or dogma.FleetContext -> its asyncio.Lock
+_locks = weakref.WeakKeyDictionary()
+
+def _lock(item):
+    # created on first use, inside the running event loop
+    lock = _locks.get(item)
+    if lock is None:
+        lock = _locks[item] = asyncio.Lock()
+    return lock
+
+def _release(locks):
+    for lock in locks:
+        lock.release()
+
+
+async def _acquire(objects):
+    """Lock objects and everything linked to them (in a fixed order, to
+    avoid deadlocks between overlapping calls) and return the locks."""
+    held = []
+    try:
+        while True:
+            group = dogma.linked_objects(objects)
+            for item in sorted(group, key=id):
+                lock = _lock(item)
+                await lock.acquire()
+                held.append(lock)
+            # links may have been made while waiting
+            if dogma.linked_objects(objects) <= group:
+                return held
+            _release(held)
+            held = []
+    except BaseException:
+        # cancelled while waiting for one of the locks
+        _release(held)
+        raise
+
+
+class AsyncWrapper(object):
+    """Forwards method calls on wrapped to the thread pool, serialized
+    with every other call on an object linked to wrapped. Arguments which
+    are wrappers themselves are passed on unwrapped."""
+    def __init__(self, wrapped, executor):
+        self.wrapped = wrapped
+        self.executor = executor or default_executor()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.wrapped, name)
+        if not callable(attribute):
+            return attribute
+        method = functools.partial(self._call, name)
+        method.__doc__ = attribute.__doc__
+        return method
+
+    async def _call(self, name, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        kwargs = dict((key, _unwrap(value)) for key, value in kwargs.items())
+        linked = [arg for arg in args + list(kwargs.values())
+                  if isinstance(arg, (dogma.Context, dogma.FleetContext))]
+        return await self.run(
+            lambda wrapped: getattr(wrapped, name)(*args, **kwargs), *linked)
+
+    async def run(self, fn, *linked):
+        """Run fn(wrapped object) on the thread pool as one serialized
+        call, e.g. to load a fit and read it back in a single await.
+        The call is also serialized with those on objects linked to the
+        contexts, fleets or wrappers in linked.
+
+        Cancelling the call does not stop fn; the locks are held until it
+        has returned.
+        """
+        locks = await _acquire([self.wrapped] +
+                               [_unwrap(other) for other in linked])
+        try:
+            future = _running_loop().run_in_executor(
+                self.executor, fn, self.wrapped)
+        except BaseException:
+            _release(locks)
+            raise
+        future.add_done_callback(lambda future: _release(locks))
+        return await asyncio.shield(future)
+
+    def linked_with(self, other):
+        return _unwrap(other) in dogma.linked_objects([self.wrapped])
+
+
+def _running_loop():
+    get_running_loop = getattr(asyncio, 'get_running_loop', None)
+    if get_running_loop is None:
+        return asyncio.get_event_loop()
+    return get_running_loop()
+
+def _unwrap(value):
+    return value.wrapped if isinstance(value, AsyncWrapper) else value
+
+
+class AsyncContext(AsyncWrapper):
+    """A dogma.Context whose methods are coroutines."""
+    def __init__(self, context=None, executor=None):
+        if context is None:
+            context = dogma.Context()
+        AsyncWrapper.__init__(self, context, executor)
+
+    @property
+    def context(self):
+        return self.wrapped
+
+    async def evaluate_fits(self, fits, attributes):
+        """Evaluate each fit from the context's baseline (see
+        Context.reset, which also drops targets and fleet membership) in
+        one serialized call. Returns a list of (values, status) pairs as
+        from Context.evaluate_fit, or (None, exception) for fits libdogma
+        refuses."""
+        return await self.run(
+            lambda context: list(context.evaluate_fits(fits, attributes)))
+
+
+class AsyncFleet(AsyncWrapper):
+    """A dogma.FleetContext whose methods are coroutines; calls are
+    serialized with those on its members and what they are linked to."""
+    def __init__(self, fleet=None, executor=None):
+        if fleet is None:
+            fleet = dogma.FleetContext()
+        AsyncWrapper.__init__(self, fleet, executor)
+
+    @property
+    def fleet(self):
+        return self.wrapped
@@ -0,0 +1,229 @@
+"""Columnar files of evaluated fit attributes.
+
+A store is a directory holding one file per column (the fit ids as
+little-endian int64, every attribute as little-endian float64, nan where
+the attribute could not be read) and a small JSON header recording the
+columns and how many rows are complete:
+
+    columns = [('velocity', dogma.Location.ship(), 37),
+               ('cap_need', ('module', 0), 6)]
+    names = []
+    with ColumnWriter('out', columns) as writer:
+        for row, (name, values, status) in enumerate(
+                dogma_io.evaluate_eft('fits.txt', types, writer.attributes)):
+            names.append(name)  # the store keeps integer ids
+            writer.append(row, values)
+
+    reader = ColumnReader('out')
+    velocity = reader.column('velocity')  # NumPy view of the mapped file
+
+Rows are buffered and written chunk_rows at a time; the header is only
+updated (atomically) once a chunk's columns are on disk, so a reader
+never sees a partial row and can pick up new ones with refresh() while
+the writer is still appending.
+"""
+import json
+import mmap
+import numbers
+import os
+import struct
+
+import dogma
+
+VERSION = 1
+HEADER = 'columns.json'
+ID_COLUMN = 'fit_id'
+FORMATS = {ID_COLUMN: 'q'}
+VALUE_FORMAT = 'd'
+
+
+def _column_path(path, name):
+    return os.path.join(path, name + '.col')
+
+
+def _encode_location(location):
+    if isinstance(location, dogma.Location):
+        return list(location.key)
+    return list(location)
+
+def _decode_location(location):
+    kind, index = location
+    if isinstance(kind, int):
+        return dogma.intern_location(kind, index)
+    return (str(kind), index)
+
+
+def _read_header(path):
+    with open(os.path.join(path, HEADER)) as f:
+        header = json.load(f)
+    if header.get('version') != VERSION:
+        raise ValueError("%s is not a version %d column store"
+                         % (path, VERSION))
+    return header
+
+
+class ColumnWriter(object):
+    """Append rows of an integer fit id and fixed attribute columns to
+    the store at path, creating it if needed.
+
+    columns is a sequence of (name, location, attribute); locations may be
+    relative to a fit as for Context.evaluate_fit. Opening an existing
+    store appends to it, after dropping any rows left incomplete by a
+    writer which did not finish; its columns must be the same.
+    """
+    def __init__(self, path, columns, chunk_rows=4096):
+        self.path = path
+        self.columns = [(str(name), location, attribute)
+                        for name, location, attribute in columns]
+        self.names = [name for name, location, attribute in self.columns]
+        if ID_COLUMN in self.names or len(set(self.names)) != len(self.names):
+            raise ValueError("column names must be unique and not %r"
+                             % ID_COLUMN)
+        self.attributes = [(location, attribute)
+                           for name, location, attribute in self.columns]
+        self.chunk_rows = chunk_rows
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if os.path.exists(os.path.join(path, HEADER)):
+            header = _read_header(path)
+            if [column['name'] for column in header['columns']] != self.names:
+                raise ValueError("%s has different columns" % path)
+            self.rows = header['rows']
+        else:
+            self.rows = 0
+            self._write_header()
+
+        self.files = {}
+        for name in [ID_COLUMN] + self.names:
+            f = open(_column_path(path, name), 'ab')
+            f.truncate(self.rows * struct.calcsize(
+                FORMATS.get(name, VALUE_FORMAT)))
+            self.files[name] = f
+        self.pending_ids = []
+        self.pending_values = [[] for name in self.names]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, fit_id, values):
+        """Add a row; fit_id is an integer and values has one entry per
+        column (or is None for a fit which could not be evaluated, giving a
+        row of nan)."""
+        if not isinstance(fit_id, numbers.Integral):
+            raise TypeError("fit ids must be integers, not %r" % (fit_id,))
+        if values is None:
+            values = [float('nan')] * len(self.names)
+        elif len(values) != len(self.names):
+            raise ValueError("expected %d values, got %d"
+                             % (len(self.names), len(values)))
+        self.pending_ids.append(fit_id)
+        for column, value in zip(self.pending_values, values):
+            column.append(value)
+        if len(self.pending_ids) >= self.chunk_rows:
+            self.flush()
+
+    def append_context(self, fit_id, context, slots=None):
+        """Add a row read from the current state of context. slots is the
+        slot map returned by load_fit, needed for fit-relative locations."""
+        if slots is None:
+            pairs = self.attributes
+        else:
+            pairs = [(dogma.fit_location(location, slots), attribute)
+                     for location, attribute in self.attributes]
+        values, status = context.get_location_attributes(pairs)
+        self.append(fit_id, values)
+
+    def flush(self):
+        """Write the buffered rows and make them visible to readers."""
+        count = len(self.pending_ids)
+        if not count:
+            return
+        self.files[ID_COLUMN].write(
+            struct.pack('<%dq' % count, *self.pending_ids))
+        for name, column in zip(self.names, self.pending_values):
+            self.files[name].write(struct.pack('<%dd' % count, *column))
+        for f in self.files.values():
+            f.flush()
+        self.rows += count
+        self.pending_ids = []
+        self.pending_values = [[] for name in self.names]
+        self._write_header()
+
+    def close(self):
+        if self.files:
+            self.flush()
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+    def _write_header(self):
+        header = {'version': VERSION,
+                  'rows': self.rows,
+                  'columns': [{'name': name,
+                               'location': _encode_location(location),
+                               'attribute': attribute}
+                              for name, location, attribute in self.columns]}
+        temporary = os.path.join(self.path, HEADER + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(header, f)
+        os.rename(temporary, os.path.join(self.path, HEADER))
+
+
+class ColumnReader(object):
+    """Read-only, memory-mapped view of a column store.
+
+    len() is the number of complete rows as of the last refresh().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.maps = {}
+        self.refresh()
+
+    def refresh(self):
+        """Pick up rows flushed since the store was opened or last
+        refreshed; returns the number of rows."""
+        header = _read_header(self.path)
+        self.columns = [(column['name'], _decode_location(column['location']),
+                         column['attribute'])
+                        for column in header['columns']]
+        self.names = [name for name, location, attribute in self.columns]
+        self.rows = header['rows']
+        self.maps = {}
+        if self.rows:
+            for name in [ID_COLUMN] + self.names:
+                with open(_column_path(self.path, name), 'rb') as f:
+                    self.maps[name] = mmap.mmap(f.fileno(), 0,
+                                                access=mmap.ACCESS_READ)
+        return self.rows
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name, start=0, stop=None):
+        """The rows [start, stop) of a column as a NumPy array sharing
+        memory with the mapped file."""
+        import numpy
+        start, stop, step = slice(start, stop).indices(self.rows)
+        dtype = numpy.dtype('<' + FORMATS.get(name, VALUE_FORMAT))
+        if name not in self.maps:
+            if name != ID_COLUMN and name not in self.names:
+                raise KeyError(name)
+            return numpy.zeros(0, dtype)
+        return numpy.frombuffer(self.maps[name], dtype, max(stop - start, 0),
+                                start * dtype.itemsize)
+
+    def row(self, index):
+        """(fit id, [values]) of one row, without NumPy."""
+        if not 0 <= index < self.rows:
+            raise IndexError(index)
+        fit_id, = struct.unpack_from('<q', self.maps[ID_COLUMN], index * 8)
+        return fit_id, [struct.unpack_from('<d', self.maps[name], index * 8)[0]
+                        for name in self.names]
+
+    def close(self):
+        # the maps themselves go once no array refers to them
+        self.maps = {}
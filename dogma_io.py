@@ -0,0 +1,202 @@
+"""Streaming import of fits in EFT and DNA text formats.
+
+Input is read a line at a time and each fit is evaluated on one reused
+Context as soon as it is complete, so memory use does not grow with the
+size of the input:
+
+    types = {'Rifter': 587, '125mm Gatling AutoCannon II': 2873, ...}
+    attributes = [(dogma.Location.ship(), 37), (('module', 0), 6)]
+    for fit_id, values, status in evaluate_eft('fits.txt', types, attributes):
+        ...
+
+libdogma knows nothing about item names or categories, so the caller
+supplies the name -> typeid mapping for EFT and, where the text format
+does not say what an item is, a typeid -> kind mapping with the kinds
+'module', 'charge', 'drone' and 'implant'. Items without a typeid or a
+usable kind (cargo, for instance) are skipped.
+"""
+import re
+from itertools import tee
+
+import dogma
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+# The modules and drones of every fit are collected in the form taken by
+# Context.load_fit; attributes may use its fit-relative locations.
+
+_count = re.compile(r'^(.*\S)\s+x(\d+)$')
+_offline = '/offline'
+
+
+def _lines(source):
+    """Iterate over the lines of a path or of a file-like object."""
+    if isinstance(source, string_types):
+        with open(source) as f:
+            for line in f:
+                yield line
+    else:
+        for line in source:
+            yield line
+
+
+def parse_eft(source, types, kinds=None, state=None):
+    """Yield (fit id, fit) for each EFT block in source.
+
+    The fit id is the name given in the [Ship, Name] header; blocks whose
+    ship is not in types are skipped. Lines of the form "Name xN" are
+    drones if kinds says so and skipped otherwise, as cargo is written
+    the same way. Other lines are modules (with an optional ", Charge"
+    and "/offline"), unless kinds says otherwise. Modules are added in
+    state, or in libdogma's default state if it is None.
+    """
+    fit_id = None
+    fit = None
+    for line in _lines(source):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == '[' and line[-1] == ']':
+            if ',' not in line:
+                # "[Empty High slot]" and the like
+                continue
+            if fit is not None:
+                yield fit_id, fit
+            ship, fit_id = line[1:-1].split(',', 1)
+            fit_id = fit_id.strip()
+            ship = types.get(ship.strip())
+            if ship is None:
+                # or load_fit would evaluate it on the baseline hull
+                fit = None
+                continue
+            fit = {'ship': ship, 'modules': [], 'implants': [], 'drones': {}}
+            continue
+        if fit is None:
+            continue
+
+        match = _count.match(line)
+        if match is not None:
+            typeid = types.get(match.group(1))
+            if typeid is None:
+                continue
+            if kinds is not None and kinds.get(typeid) == 'drone':
+                fit['drones'][typeid] = (fit['drones'].get(typeid, 0) +
+                                         int(match.group(2)))
+            continue
+
+        module_state = state
+        if line.lower().endswith(_offline):
+            line = line[:-len(_offline)].rstrip()
+            module_state = dogma.State.OFFLINE
+        name, _, charge = line.partition(',')
+        typeid = types.get(name.strip())
+        if typeid is None:
+            continue
+        kind = 'module' if kinds is None else kinds.get(typeid)
+        if kind == 'implant':
+            fit['implants'].append(typeid)
+        elif kind == 'module':
+            fit['modules'].append(
+                (typeid, module_state, types.get(charge.strip())))
+    if fit is not None:
+        yield fit_id, fit
+
+
+def parse_dna(source, kinds, charge_fits=None, state=None):
+    """Yield (fit id, fit) for each DNA string in source, one per line.
+
+    A line may start with a fit id separated from the DNA by whitespace;
+    otherwise the fit id is the line number. kinds maps the typeids to
+    their kind. DNA does not say which module a charge goes in, so each
+    module is given the first charge for which charge_fits(module typeid,
+    charge typeid) is true, and charges are left out without charge_fits.
+    Modules marked offline (a typeid ending in "_") are added offline,
+    the others in state.
+    Malformed lines raise ValueError.
+    """
+    for number, line in enumerate(_lines(source), 1):
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) == 1:
+            fit_id, dna = number, fields[0]
+        else:
+            fit_id, dna = fields[0], fields[1]
+
+        items = dna.split(':')
+        try:
+            fit = {'ship': int(items[0]), 'modules': [], 'implants': [],
+                   'drones': {}}
+            charges = []
+            for item in items[1:]:
+                if not item:
+                    continue
+                typeid, _, quantity = item.partition(';')
+                module_state = state
+                if typeid.endswith('_'):
+                    typeid = typeid[:-1]
+                    module_state = dogma.State.OFFLINE
+                typeid = int(typeid)
+                quantity = int(quantity) if quantity else 1
+                kind = kinds.get(typeid)
+                if kind == 'module':
+                    fit['modules'].extend([(typeid, module_state, None)] *
+                                          quantity)
+                elif kind == 'charge':
+                    charges.append(typeid)
+                elif kind == 'drone':
+                    fit['drones'][typeid] = (fit['drones'].get(typeid, 0) +
+                                             quantity)
+                elif kind == 'implant':
+                    fit['implants'].extend([typeid] * quantity)
+        except ValueError:
+            raise ValueError("line %d: malformed DNA %r" % (number, dna))
+
+        if charges and charge_fits is not None:
+            modules = fit['modules']
+            for i, (module, module_state, _) in enumerate(modules):
+                for charge in charges:
+                    if charge_fits(module, charge):
+                        modules[i] = (module, module_state, charge)
+                        break
+        yield fit_id, fit
+
+
+def evaluate(fits, attributes, context=None):
+    """Yield (fit id, values, status) for each (fit id, fit) in fits, as
+    returned by Context.evaluate_fit. Fits libdogma refuses to load yield
+    (fit id, None, exception).
+
+    Every fit is loaded onto the same context by Context.evaluate_fits,
+    which resets it to its baseline in between; anything set up before
+    the first fit (skills, for instance) becomes the baseline if none was
+    set.
+    """
+    if context is None:
+        context = dogma.Context()
+    fits, fit_ids = tee(fits)
+    results = context.evaluate_fits((fit for fit_id, fit in fits), attributes)
+    for (fit_id, fit), (values, status) in zip(fit_ids, results):
+        yield fit_id, values, status
+
+
+def evaluate_eft(source, types, attributes, context=None, kinds=None,
+                 state=None):
+    """parse_eft and evaluate in one go."""
+    return evaluate(parse_eft(source, types, kinds, state), attributes,
+                    context)
+
+
+def evaluate_dna(source, kinds, attributes, context=None, charge_fits=None,
+                 state=None):
+    """parse_dna and evaluate in one go."""
+    return evaluate(parse_dna(source, kinds, charge_fits, state), attributes,
+                    context)
@@ -0,0 +1,130 @@
+"""Evaluate fits on a pool of worker processes.
+
+libdogma contexts cannot be shared between threads, so fits are spread over
+processes instead. Workers are forked once libdogma's static data has been
+loaded in the parent, and each keeps a pool of warm Contexts which are
+reset between fits rather than recreated.
+
+    with ParallelEvaluator([(dogma.Location.ship(), 37)]) as evaluator:
+        for index, values, status in evaluator.evaluate(fits):
+            ...
+"""
+import itertools
+import multiprocessing
+from collections import deque
+
+import dogma
+
+
+_contexts = None
+_attributes = None
+
+def _init_worker(attributes):
+    global _contexts, _attributes
+    _contexts = dogma.ContextPool()
+    _attributes = attributes
+
+def _evaluate_chunk(chunk):
+    results = []
+    for index, fit in chunk:
+        with _contexts.context() as context:
+            try:
+                values, status = context.evaluate_fit(fit, _attributes)
+            except dogma.DogmaException as e:
+                values, status = None, e
+        results.append((index, values, status))
+    return results
+
+
+def _fork_context():
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return multiprocessing
+    return get_context('fork')
+
+
+class ParallelEvaluator(object):
+    """A pool of worker processes evaluating fits.
+
+    attributes is a sequence of (location, attribute) pairs as taken by
+    Context.evaluate_fit. Fits are sent to workers chunksize at a time, with
+    at most max_pending chunks in flight (by default two per process), so
+    arbitrarily long iterables of fits can be streamed through.
+    """
+    def __init__(self, attributes, processes=None, chunksize=64,
+                 max_pending=None):
+        # load libdogma's static data once, before forking
+        dogma.init()
+        mp = _fork_context()
+        if processes is None:
+            processes = mp.cpu_count()
+        self.processes = processes
+        self.chunksize = chunksize
+        self.max_pending = max_pending or 2 * processes
+        self.pool = mp.Pool(processes, _init_worker, (list(attributes),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def _chunks(self, fits):
+        fits = enumerate(fits)
+        while True:
+            chunk = list(itertools.islice(fits, self.chunksize))
+            if not chunk:
+                return
+            yield chunk
+
+    def evaluate(self, fits, ordered=True):
+        """Yield (index, values, status) for each fit, where index is the
+        position of the fit in fits and values/status are as returned by
+        Context.evaluate_fit. A fit libdogma refuses to load yields
+        (index, None, exception).
+
+        With ordered=False results are yielded as chunks complete.
+        """
+        if ordered:
+            return self._evaluate_ordered(fits)
+        return self._evaluate_as_completed(fits)
+
+    def _evaluate_ordered(self, fits):
+        pending = deque()
+        for chunk in self._chunks(fits):
+            if len(pending) >= self.max_pending:
+                for result in pending.popleft().get():
+                    yield result
+            pending.append(self.pool.apply_async(_evaluate_chunk, (chunk,)))
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+
+    def _evaluate_as_completed(self, fits):
+        pending = []
+        chunks = self._chunks(fits)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.max_pending:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.append(
+                        self.pool.apply_async(_evaluate_chunk, (chunk,)))
+            if not pending:
+                return
+            for result in self._wait_any(pending).get():
+                yield result
+
+    @staticmethod
+    def _wait_any(pending):
+        while True:
+            for i, result in enumerate(pending):
+                if result.ready():
+                    return pending.pop(i)
+            pending[0].wait(0.01)
@@ -0,0 +1,73 @@
+"""Effects of every attacker's projected modules on every target.
+
+    values, status = projection_matrix([web_ship, neut_ship],
+                                       [frigate, cruiser, battleship],
+                                       [(dogma.Location.ship(), 37)])
+
+runs each attacker's projectable modules against each target in turn and
+reads the given target attributes. Attackers go one at a time, moving
+their modules from one target to the next without clearing them in
+between, and the targets the modules had before are restored at the end.
+"""
+from array import array
+
+import dogma
+
+
+def projectable_slots(context, slots=None):
+    """The slots of context's modules, or of those in slots, which have
+    projectable effects."""
+    if slots is None:
+        slots = sorted(context._modules)
+    return [slot for slot in slots
+            if dogma.type_has_projectable_effects(context._modules[slot][0])]
+
+
+def projection_matrix(attackers, targets, attributes):
+    """Read attributes of each target with each attacker projecting on it
+    alone (on top of whatever already targets it).
+
+    attackers is a sequence of contexts, whose projectable modules are
+    used, or of (context, slots) pairs. attributes is a sequence of
+    (location, attribute) pairs on the target. Returns (values, status) as
+    for Context.get_attributes, flat attackers x targets x attributes
+    arrays: the cell of attacker i, target j and attribute k is at
+    (i * len(targets) + j) * len(attributes) + k.
+    """
+    attackers = [(attacker, None)
+                 if isinstance(attacker, dogma.Context) else attacker
+                 for attacker in attackers]
+    targets = list(targets)
+    attributes = list(attributes)
+    width = len(attributes)
+    row = len(targets) * width
+    values = array('d', [0.0]) * (len(attackers) * row)
+    status = array('b', [dogma.OK]) * (len(attackers) * row)
+
+    # what each target looks like without the attackers, for those which
+    # have nothing to project
+    baseline = None
+
+    for i, (attacker, slots) in enumerate(attackers):
+        locations = [dogma.Location.module(slot)
+                     for slot in projectable_slots(attacker, slots)]
+        if not locations:
+            if baseline is None:
+                baseline = [target.get_location_attributes(attributes)
+                            for target in targets]
+            for j, (target_values, target_status) in enumerate(baseline):
+                offset = i * row + j * width
+                values[offset:offset + width] = target_values
+                status[offset:offset + width] = target_status
+            continue
+        _sweep(attacker, locations, targets, attributes, values, status,
+               i * row)
+    return values, status
+
+
+def _sweep(attacker, locations, targets, attributes, values, status, offset):
+    with attacker.retargeting(locations) as aim:
+        for j, targetee in enumerate(targets):
+            aim(targetee)
+            targetee.get_location_attributes(
+                attributes, values, status, offset + j * len(attributes))
@@ -0,0 +1,174 @@
+"""Precomputed static type data for filtering item lists.
+
+The type_* functions in dogma keep LRU caches for point lookups. A
+TypeIndex goes further for a known set of types: it asks libdogma once
+for each type's effect flags, effects with attributes and, optionally,
+some base attributes, and keeps the answers in flat arrays. An index can
+be saved to a file and loaded back memory-mapped, so that worker
+processes start warm without querying libdogma at all.
+"""
+import mmap
+import struct
+from bisect import bisect_left
+from ctypes import (addressof, c_double, c_int32, c_uint8, c_uint16,
+                    c_uint32, sizeof, string_at)
+
+import dogma
+
+ACTIVE = 1 << 0
+OVERLOAD = 1 << 1
+PROJECTABLE = 1 << 2
+
+MAGIC = b'DOGMATYP'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII')  # magic, version, types, effects, attributes
+ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class TypeIndex(object):
+    """Static data for a sorted set of typeids, stored as ctypes arrays:
+
+    - typeids: the typeids, sorted
+    - flags: ACTIVE | OVERLOAD | PROJECTABLE bits for each type
+    - effect_offsets, effects: the effects with attributes of typeids[i]
+      are effects[effect_offsets[i]:effect_offsets[i + 1]]
+    - attributes, base_attributes: base_attributes[i * len(attributes) + j]
+      is the base value of attributes[j] for typeids[i], or nan
+    """
+    def __init__(self, typeids, flags, effect_offsets, effects, attributes,
+                 base_attributes, buffer=None):
+        self.typeids = typeids
+        self.flags = flags
+        self.effect_offsets = effect_offsets
+        self.effects = effects
+        self.attributes = attributes
+        self.base_attributes = base_attributes
+        self.attribute_columns = dict((attribute, j)
+                                      for j, attribute in enumerate(attributes))
+        # keeps the mapped file of a loaded index alive
+        self.buffer = buffer
+
+    @classmethod
+    def build(cls, typeids, attributes=()):
+        """Query libdogma for every type in typeids."""
+        typeids = sorted(set(typeids))
+        attributes = list(attributes)
+        nan = float('nan')
+        flags = []
+        effect_offsets = [0]
+        effects = []
+        base_attributes = []
+        for typeid in typeids:
+            flags.append(
+                (ACTIVE if dogma.type_has_active_effects(typeid) else 0) |
+                (OVERLOAD if dogma.type_has_overload_effects(typeid) else 0) |
+                (PROJECTABLE if dogma.type_has_projectable_effects(typeid)
+                 else 0))
+            effects.extend(dogma.type_effects_with_attributes(typeid))
+            effect_offsets.append(len(effects))
+            for attribute in attributes:
+                try:
+                    base_attributes.append(
+                        dogma.type_base_attribute(typeid, attribute))
+                except dogma.DogmaException:
+                    base_attributes.append(nan)
+        return cls((c_uint32 * len(typeids))(*typeids),
+                   (c_uint8 * len(flags))(*flags),
+                   (c_uint32 * len(effect_offsets))(*effect_offsets),
+                   (c_int32 * len(effects))(*effects),
+                   (c_uint16 * len(attributes))(*attributes),
+                   (c_double * len(base_attributes))(*base_attributes))
+
+    def _arrays(self):
+        return [self.typeids, self.flags, self.effect_offsets, self.effects,
+                self.attributes, self.base_attributes]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.typeids),
+                                len(self.effects), len(self.attributes)))
+            offset = HEADER.size
+            for array in self._arrays():
+                padding = _aligned(offset) - offset
+                f.write(b'\0' * padding)
+                f.write(string_at(addressof(array), sizeof(array)))
+                offset += padding + sizeof(array)
+            # so that empty trailing arrays still lie within the file
+            f.write(b'\0' * (_aligned(offset) - offset))
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved index into memory. Pages are shared with every other
+        process mapping the same file until written to."""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, version, types, effects, attributes = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d type index"
+                             % (path, VERSION))
+        arrays = []
+        offset = HEADER.size
+        for typ, size in [(c_uint32, types), (c_uint8, types),
+                          (c_uint32, types + 1), (c_int32, effects),
+                          (c_uint16, attributes),
+                          (c_double, types * attributes)]:
+            offset = _aligned(offset)
+            arrays.append((typ * size).from_buffer(buffer, offset))
+            offset += sizeof(typ) * size
+        return cls(*arrays, buffer=buffer)
+
+    def __len__(self):
+        return len(self.typeids)
+
+    def __contains__(self, typeid):
+        return self._find(typeid) is not None
+
+    def _find(self, typeid):
+        i = bisect_left(self.typeids, typeid)
+        if i < len(self.typeids) and self.typeids[i] == typeid:
+            return i
+        return None
+
+    def _flag(self, typeid, flag, fallback):
+        i = self._find(typeid)
+        if i is None:
+            return fallback(typeid)
+        return bool(self.flags[i] & flag)
+
+    # Types outside the index fall back to the (cached) libdogma queries.
+
+    def has_active_effects(self, typeid):
+        return self._flag(typeid, ACTIVE, dogma.type_has_active_effects)
+
+    def has_overload_effects(self, typeid):
+        return self._flag(typeid, OVERLOAD, dogma.type_has_overload_effects)
+
+    def has_projectable_effects(self, typeid):
+        return self._flag(typeid, PROJECTABLE,
+                          dogma.type_has_projectable_effects)
+
+    def effects_with_attributes(self, typeid):
+        i = self._find(typeid)
+        if i is None:
+            return dogma.type_effects_with_attributes(typeid)
+        return tuple(self.effects[self.effect_offsets[i]:
+                                  self.effect_offsets[i + 1]])
+
+    def base_attribute(self, typeid, attribute):
+        i = self._find(typeid)
+        j = self.attribute_columns.get(attribute)
+        if i is None or j is None:
+            return dogma.type_base_attribute(typeid, attribute)
+        value = self.base_attributes[i * len(self.attributes) + j]
+        if value != value:
+            raise dogma.NotFoundException
+        return value
+
+    def select(self, flags):
+        """The indexed typeids which have all of flags set."""
+        return [typeid for typeid, type_flags in zip(self.typeids, self.flags)
+                if type_flags & flags == flags]
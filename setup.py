@@ -5,5 +5,7 @@ setup(name='dogma',
       description='Python bindings for libdogma',
       author='Josiah Boning',
       author_email='jboning@gmail.com',
-      py_modules=['dogma']
+      py_modules=['dogma', 'dogma_parallel', 'dogma_types', 'dogma_io',
+                  'dogma_columns', 'dogma_async', 'dogma_projection',
+                  'dogma_timeline']
      )
@@ -1,8 +1,11 @@
 import os
 import gc
+import random
 import subprocess
+import sys
 
 from contextlib import contextmanager
+from ctypes import addressof, sizeof, string_at
 from unittest import TestCase
 
 import dogma
@@ -120,6 +123,499 @@ class TestDogma(TestCase):
         fleet = None
         ctx = None
 
+    def test_location(self):
+        loc = dogma.Location.module(3)
+        self.assertIs(dogma.Location.module(3), loc)
+        self.assertEqual(dogma.Location(type=dogma.Location.MODULE,
+                                        union=dogma.LocationUnion(module_index=3)), loc)
+        self.assertNotEqual(dogma.Location.charge(3), loc)
+        self.assertEqual({loc: 1}[dogma.Location.module(3)], 1)
+        self.assertEqual(str(loc), '4:3')
+        self.assertEqual(str(dogma.Location.ship()), '3:')
+        with self.assertRaises(AttributeError):
+            loc.type = dogma.Location.CHARGE
+        with self.assertRaises(AttributeError):
+            loc.union.module_index = 7
+        self.assertEqual(dogma.Location.module(3).union.module_index, 3)
+        view = dogma.Location.from_buffer(
+            bytearray(string_at(addressof(loc), sizeof(loc))))
+        self.assertEqual(view, loc)
+        self.assertEqual(hash(view), hash(loc))
+
+    def test_bad_arguments(self):
+        ctx = dogma.Context()
+        other = dogma.Context()
+        with self.assertRaises(TypeError):
+            ctx.target((dogma.Location.MODULE, 0), other)
+        self.assertEqual(len(ctx.targets_by_location), 0)
+        self.assertEqual(len(other.targeters), 0)
+        self.assertFalse(ctx._linked)
+        ctx.reset()
+
+    def test_get_attributes(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_SmallAncillaryShieldBooster, charge=TYPE_CapBooster25)
+
+        locations = [dogma.Location.ship(), dogma.Location.module(slot),
+                     dogma.Location.module(slot + 1)]
+        values, status = ctx.get_attributes(
+            locations, [ATT_MaxLockedTargets, ATT_CapacitorNeed])
+        self.assertEqual(len(values), 6)
+        self.assertEqual(values[0], ctx.get_ship_attribute(ATT_MaxLockedTargets))
+        self.assertEqual(values[3], ctx.get_module_attribute(slot, ATT_CapacitorNeed))
+        self.assertEqual(list(status[:4]), [dogma.OK] * 4)
+        self.assertEqual(list(status[4:]), [dogma.NOT_FOUND] * 2)
+        self.assertNotEqual(values[4], values[4])
+
+        with self.assertRaises(ValueError):
+            ctx.get_attributes(locations, [ATT_MaxLockedTargets],
+                               out=[0.0] * 2)
+
+    def test_attribute_cache(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        ctx.enable_attribute_cache(maxsize=16)
+
+        velocity = ctx.get_ship_attribute(ATT_MaxVelocity)
+        self.assertEqual(ctx.get_location_attribute(dogma.Location.ship(), ATT_MaxVelocity), velocity)
+        self.assertEqual(ctx.attribute_cache_info().hits, 1)
+        self.assertEqual(ctx.attribute_cache_info().misses, 1)
+
+        attacker = dogma.Context()
+        attacker.set_ship(TYPE_Rifter)
+        slot = attacker.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE)
+        loc = dogma.Location.module(slot)
+        attacker.target(loc, ctx)
+        self.assertLess(ctx.get_ship_attribute(ATT_MaxVelocity), velocity)
+        attacker.set_module_state(slot, dogma.State.ONLINE)
+        self.assertEqual(ctx.get_ship_attribute(ATT_MaxVelocity), velocity)
+        attacker.clear_target(loc)
+        self.assertEqual(len(ctx.targeters), 0)
+        self.assertEqual(ctx.attribute_cache_info().hits, 1)
+
+        fleet = dogma.FleetContext()
+        fleet.add_squad_member(0, 0, ctx)
+        self.assertIs(ctx.fleet, fleet)
+        generation = ctx._generation
+        fleet.add_squad_member(0, 0, attacker)
+        self.assertGreater(ctx._generation, generation)
+
+        fleet.remove_fleet_member(attacker)
+        attacker.set_module_state(slot, dogma.State.ACTIVE)
+        attacker.target(loc, ctx)
+        self.assertLess(ctx.get_ship_attribute(ATT_MaxVelocity), velocity)
+        attacker = None
+        gc.collect()
+        self.assertEqual(len(ctx.targeters), 0)
+        self.assertEqual(ctx.get_ship_attribute(ATT_MaxVelocity), velocity)
+
+        # freeing the fleet drops the boosts of its members
+        generation = ctx._generation
+        fleet = None
+        gc.collect()
+        self.assertIsNone(ctx.fleet)
+        self.assertGreater(ctx._generation, generation)
+
+        ctx.disable_attribute_cache()
+        self.assertIsNone(ctx.attribute_cache_info())
+
+    def test_context_pool(self):
+        def setup(ctx):
+            ctx.set_ship(TYPE_Rifter)
+            ctx.set_default_skill_level(4)
+
+        pool = dogma.ContextPool(maxsize=1, setup=setup)
+        with pool.context() as ctx:
+            baseline = ctx.get_character_attribute(ATT_MaxActiveDrones)
+            locked = ctx.get_ship_attribute(ATT_MaxLockedTargets)
+            slot = ctx.add_module(TYPE_SmallAncillaryShieldBooster, charge=TYPE_CapBooster25)
+            ctx.add_implant(TYPE_SnakeOmega)
+            ctx.add_drone(TYPE_WarriorI, 2)
+            ctx.set_skill_level(TYPE_Drones, 0)
+            ctx.set_ship(TYPE_Scimitar)
+        self.assertEqual(pool.free, [ctx])
+
+        with pool.context() as same:
+            self.assertIs(same, ctx)
+            self.assertEqual(ctx.get_character_attribute(ATT_MaxActiveDrones), baseline)
+            self.assertEqual(ctx.get_ship_attribute(ATT_MaxLockedTargets), locked)
+            with self.assertRaises(dogma.NotFoundException):
+                ctx.get_module_attribute(slot, ATT_CapacitorNeed)
+            with self.assertRaises(dogma.NotFoundException):
+                ctx.get_drone_attribute(TYPE_WarriorI, ATT_DroneBandwidthUsed)
+            other = pool.checkout()
+        self.assertIsNot(other, ctx)
+        pool.checkin(other)
+        self.assertEqual(len(pool.free), 1)
+
+    def test_reset_chance_based_effects(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        loc = dogma.Location.implant(ctx.add_implant(TYPE_StrongBluePillBooster))
+        shield = ctx.get_ship_attribute(ATT_ShieldCapacity)
+        ctx.set_baseline()
+
+        ctx.toggle_chance_based_effect(loc, EFFECT_BoosterShieldCapacityPenalty, True)
+        penalized = ctx.get_ship_attribute(ATT_ShieldCapacity)
+        self.assertLess(penalized, shield)
+        ctx.reset()
+        self.assertEqual(ctx.get_ship_attribute(ATT_ShieldCapacity), shield)
+
+        ctx.toggle_chance_based_effect(loc, EFFECT_BoosterShieldCapacityPenalty, True)
+        ctx.set_baseline()
+        ctx.toggle_chance_based_effect(loc, EFFECT_BoosterShieldCapacityPenalty, False)
+        ctx.reset()
+        self.assertEqual(ctx.get_ship_attribute(ATT_ShieldCapacity), penalized)
+
+    def test_load_fit(self):
+        ctx = dogma.Context()
+        slots = ctx.load_fit({
+            'default_skill_level': 4,
+            'skills': {TYPE_Drones: 0},
+            'ship': TYPE_Rifter,
+            'implants': [TYPE_SnakeOmega],
+            'modules': [TYPE_StasisWebifierI,
+                        (TYPE_SmallAncillaryShieldBooster, dogma.State.ACTIVE),
+                        (TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25),
+                        (TYPE_125mmGatlingAutoCannonII, dogma.State.ACTIVE, TYPE_BarrageS)],
+            'drones': {TYPE_WarriorI: 2},
+        })
+        self.assertEqual(len(slots['implants']), 1)
+        self.assertEqual(len(slots['modules']), 4)
+        self.assertEqual(len(set(slots['modules'])), 4)
+
+        self.assertEqual(ctx.get_character_attribute(ATT_MaxActiveDrones), 0.0)
+        self.assertEqual(ctx.get_ship_attribute(ATT_MaxLockedTargets), 4.0)
+        self.assertEqual(ctx.get_implant_attribute(slots['implants'][0], ATT_Implantness), 6.0)
+        self.assertEqual(ctx.get_module_attribute(slots['modules'][2], ATT_CapacitorNeed), 0.0)
+        self.assertEqual(ctx.get_charge_attribute(slots['modules'][2], ATT_CapacitorBonus), 25.0)
+        self.assertEqual(ctx.get_drone_attribute(TYPE_WarriorI, ATT_DroneBandwidthUsed), 5.0)
+
+    def test_load_fit_casts(self):
+        ctx = dogma.Context()
+        with self.assertRaises(TypeError):
+            ctx.load_fit({'ship': TYPE_Rifter, 'modules': ['webifier']})
+        self.assertEqual(ctx.get_fit()['ship'], 0)
+
+        if sys.version_info < (3, 8):
+            return
+        class Index(object):
+            # an integer which is not an int, like NumPy's
+            def __init__(self, value):
+                self.value = value
+            def __index__(self):
+                return self.value
+        slots = ctx.load_fit({'ship': Index(TYPE_Rifter),
+                              'modules': [(Index(TYPE_StasisWebifierI), dogma.State.ACTIVE)],
+                              'drones': {Index(TYPE_WarriorI): Index(2)}})
+        self.assertEqual(ctx.get_fit()['ship'], TYPE_Rifter)
+        self.assertEqual(ctx.get_fit()['modules'],
+                         [(TYPE_StasisWebifierI, dogma.State.ACTIVE, None)])
+        self.assertEqual(ctx.get_fit()['drones'], {TYPE_WarriorI: 2})
+
+    def test_apply_fit_diff(self):
+        ctx = dogma.Context()
+        fit = {'ship': TYPE_Rifter,
+               'modules': [TYPE_StasisWebifierI,
+                           (TYPE_SmallAncillaryShieldBooster, dogma.State.ACTIVE),
+                           (TYPE_125mmGatlingAutoCannonII, dogma.State.ACTIVE, TYPE_BarrageS)],
+               'drones': {TYPE_WarriorI: 2}}
+        slots = ctx.load_fit(fit)['modules']
+        self.assertEqual(ctx.get_fit()['modules'], [dogma.module_spec(m) for m in fit['modules']])
+
+        fit['modules'][0] = (TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25)
+        fit['modules'][2] = (TYPE_125mmGatlingAutoCannonII, dogma.State.ONLINE, None)
+        fit['drones'] = {TYPE_WarriorI: 1}
+        new_slots = ctx.apply_fit_diff(fit)['modules']
+        self.assertEqual(new_slots, slots)
+        self.assertEqual(ctx.get_module_attribute(slots[0], ATT_CapacitorNeed), 0.0)
+        with self.assertRaises(dogma.NotFoundException):
+            ctx.get_charge_attribute(slots[2], ATT_CapacitorBonus)
+        self.assertEqual(ctx.get_fit()['drones'], {TYPE_WarriorI: 1})
+
+        fit['modules'].reverse()
+        self.assertEqual(ctx.apply_fit_diff(fit)['modules'], list(reversed(slots)))
+
+        fit['modules'] = fit['modules'][:1]
+        del fit['drones']
+        self.assertEqual(ctx.apply_fit_diff(fit)['modules'], [slots[2]])
+        self.assertEqual(len(ctx.get_fit()['modules']), 1)
+        self.assertEqual(ctx.get_fit()['drones'], {TYPE_WarriorI: 1})
+
+        ctx.set_skill_level(TYPE_Drones, 0)
+        ctx.apply_fit_diff({'default_skill_level': 3})
+        self.assertEqual(ctx.get_fit()['skills'], {TYPE_Drones: 0})
+        self.assertEqual(ctx.get_character_attribute(ATT_MaxActiveDrones), 0.0)
+
+    def test_apply_skill_profile(self):
+        ctx = dogma.Context()
+        profile = dogma.SkillProfile({TYPE_Drones: 0, TYPE_Gunnery: 3}, default_level=4)
+        self.assertEqual(profile, dogma.SkillProfile([(TYPE_Gunnery, 3), (TYPE_Drones, 0)], 4))
+        self.assertEqual(profile.level(TYPE_Drones), 0)
+        self.assertEqual(profile.level(TYPE_SmallHybridTurret), 4)
+
+        ctx.apply_skill_profile(profile)
+        self.assertEqual(ctx.get_skill_attribute(TYPE_Drones, ATT_SkillLevel), 0.0)
+        self.assertEqual(ctx.get_skill_attribute(TYPE_Gunnery, ATT_SkillLevel), 3.0)
+        self.assertEqual(ctx.get_skill_attribute(TYPE_SmallHybridTurret, ATT_SkillLevel), 4.0)
+
+        generation = ctx._generation
+        ctx.apply_skill_profile(profile)
+        self.assertEqual(ctx._generation, generation)
+
+        ctx.apply_skill_profile(dogma.SkillProfile({TYPE_Gunnery: 3}))
+        self.assertEqual(ctx.get_skill_attribute(TYPE_Drones, ATT_SkillLevel), 5.0)
+        self.assertEqual(ctx.get_skill_attribute(TYPE_SmallHybridTurret, ATT_SkillLevel), 5.0)
+        self.assertEqual(ctx.get_fit()['default_skill_level'], 5)
+
+    def test_skill_sweep(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        ctx.set_skill_level(TYPE_Gunnery, 3)
+
+        values, status = ctx.skill_sweep(
+            [TYPE_Drones, TYPE_Gunnery],
+            [(dogma.Location.char(), ATT_MaxActiveDrones)])
+        self.assertEqual(list(values[:6]), [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(list(values[6:]), [5.0] * 6)
+        self.assertEqual(list(status), [dogma.OK] * 12)
+
+        self.assertEqual(ctx.get_fit()['skills'], {TYPE_Gunnery: 3})
+        self.assertEqual(ctx.get_character_attribute(ATT_MaxActiveDrones), 5.0)
+
+        # through the cpu of the gun, which adds to the ship's cpu load
+        ctx.add_module(TYPE_125mmGatlingAutoCannonII)
+        values, status = ctx.skill_sweep(
+            [TYPE_WeaponUpgrades], [(dogma.Location.ship(), ATT_CpuLoad)])
+        self.assertGreater(values[0], values[5])
+
+    def test_skill_sweep_restores_each_skill(self):
+        # both skills affect the rate of fire of the gun
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_125mmGatlingAutoCannonII)
+        ctx.set_skill_level(TYPE_Gunnery, 5)
+        ctx.set_skill_level(TYPE_RapidFiring, 4)
+        skills = [TYPE_Gunnery, TYPE_RapidFiring]
+
+        values, status = ctx.skill_sweep(
+            skills, [(dogma.Location.module(slot), ATT_Speed)])
+        self.assertEqual(ctx.get_fit()['skills'],
+                         {TYPE_Gunnery: 5, TYPE_RapidFiring: 4})
+
+        expected = []
+        for skill in skills:
+            level_now = ctx.get_fit()['skills'][skill]
+            for level in range(6):
+                ctx.set_skill_level(skill, level)
+                expected.append(ctx.get_module_attribute(slot, ATT_Speed))
+            ctx.set_skill_level(skill, level_now)
+        self.assertEqual(list(values), expected)
+        self.assertEqual(list(status), [dogma.OK] * 12)
+
+    def test_side_effect_distribution(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_implant(TYPE_StrongBluePillBooster)
+        loc = dogma.Location.implant(slot)
+        shield = [(dogma.Location.ship(), ATT_ShieldCapacity)]
+        before = ctx.get_ship_attribute(ATT_ShieldCapacity)
+
+        effects = ctx.chance_based_effects()
+        self.assertIn((loc, EFFECT_BoosterShieldCapacityPenalty, 0.3), effects)
+        bit = 1 << [effect for location, effect, chance
+                    in effects].index(EFFECT_BoosterShieldCapacityPenalty)
+
+        combinations, weights, values, status = \
+            ctx.side_effect_distribution(shield)
+        self.assertEqual(combinations, list(range(1 << len(effects))))
+        self.assertAlmostEqual(sum(weights), 1.0)
+        self.assertEqual(list(status), [dogma.OK] * len(combinations))
+        self.assertEqual(values[0], before)
+        self.assertLess(values[bit], before)
+        self.assertEqual(ctx.get_ship_attribute(ATT_ShieldCapacity), before)
+        self.assertEqual(
+            ctx.side_effect_distribution(shield),
+            (combinations, weights, values, status))
+
+        ctx.toggle_chance_based_effect(
+            loc, EFFECT_BoosterShieldCapacityPenalty, True)
+        penalized = ctx.get_ship_attribute(ATT_ShieldCapacity)
+        exact = dogma.MAX_EXACT_SIDE_EFFECTS
+        dogma.MAX_EXACT_SIDE_EFFECTS = 0
+        try:
+            combinations, weights, values, status = \
+                ctx.side_effect_distribution(shield, samples=1000,
+                                             rng=random.Random(0))
+        finally:
+            dogma.MAX_EXACT_SIDE_EFFECTS = exact
+        self.assertAlmostEqual(sum(weights), 1.0)
+        self.assertEqual(combinations, sorted(set(combinations)))
+        self.assertEqual(ctx.get_ship_attribute(ATT_ShieldCapacity), penalized)
+
+    def test_profiling(self):
+        set_ship = dogma.Context.__dict__['set_ship']
+        dogma.enable_profiling()
+        try:
+            self.assertTrue(dogma.profiling_enabled())
+            ctx = dogma.Context()
+            ctx.set_ship(TYPE_Rifter)
+            with self.assertRaises(dogma.NotFoundException):
+                ctx.get_module_attribute(0, ATT_CapacitorNeed)
+            ctx.get_attributes([dogma.Location.ship()], [ATT_MaxVelocity])
+        finally:
+            dogma.disable_profiling()
+        self.assertFalse(dogma.profiling_enabled())
+        self.assertIs(dogma.Context.__dict__['set_ship'], set_ship)
+
+        snapshot = dogma.profiling_snapshot()
+        self.assertEqual(snapshot['Context.set_ship']['calls'], 1)
+        self.assertEqual(snapshot['dogma_set_ship']['calls'], 1)
+        self.assertEqual(snapshot['dogma_set_ship']['errors'], 0)
+        self.assertEqual(snapshot['dogma_get_module_attribute']['errors'], 1)
+        self.assertEqual(snapshot['Context.get_module_attribute']['errors'], 1)
+        self.assertEqual(snapshot['dogma_get_location_attribute']['calls'], 1)
+        self.assertGreaterEqual(snapshot['Context.set_ship']['total'],
+                                snapshot['dogma_set_ship']['total'])
+        self.assertGreater(dogma.profiling_stats().total_calls, 0)
+
+        dogma.reset_profiling()
+        self.assertEqual(dogma.profiling_snapshot(), {})
+        self.assertEqual(dogma.profiling_stats().total_calls, 0)
+
+    def test_lazy_init(self):
+        code = ("import dogma; "
+                "assert isinstance(dogma.libdogma, dogma.LazyLibrary); "
+                "dogma.Location.ship(); "
+                "assert isinstance(dogma.libdogma, dogma.LazyLibrary); "
+                "dogma.Context(); "
+                "assert not isinstance(dogma.libdogma, dogma.LazyLibrary); "
+                "assert dogma.init() is dogma.libdogma; "
+                "assert dogma.init(dogma.LIBRARY_PATH) is dogma.libdogma")
+        subprocess.check_call([sys.executable, '-c', code])
+
+        code = ("import dogma; "
+                "assert isinstance(dogma.libdogma, dogma.LazyLibrary); "
+                "assert dogma.profiling_enabled(); "
+                "dogma.Context(); "
+                "assert dogma.profiling_snapshot()['dogma_init_context']['calls'] == 1")
+        env = dict(os.environ, DOGMA_PROFILE='1')
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        code = ("import dogma; "
+                "assert not dogma.profiling_enabled(); "
+                "assert dogma.profiling_stats().total_calls == 0")
+        env = dict(os.environ, DOGMA_PROFILE='0')
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+
+        # a context whose library failed to load has nothing to free
+        code = ("import dogma\n"
+                "dogma.LIBRARY_PATH = '/nonexistent/libdogma.so'\n"
+                "try:\n"
+                "    dogma.Context()\n"
+                "except OSError:\n"
+                "    pass\n")
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   stderr=subprocess.PIPE)
+        self.assertEqual(process.communicate()[1], b'')
+        self.assertEqual(process.returncode, 0)
+
+        dogma.init()
+        with self.assertRaises(ValueError):
+            dogma.init('/nonexistent/libdogma.so')
+
+    def test_fleet_tree(self):
+        members = [dogma.Context() for i in range(6)]
+        for ctx in members:
+            ctx.set_ship(TYPE_Rifter)
+        a, b, c, d, e, f = members
+        tree = {'commander': a,
+                'booster': a,
+                'wings': [{'commander': b,
+                           'squads': {0: {'commander': c,
+                                          'booster': c,
+                                          'members': [d, e]}}}]}
+        fleet = dogma.FleetContext.from_tree(tree)
+        self.assertEqual(set(fleet.members), set([a, b, c, d, e]))
+        self.assertEqual(fleet.position(d), (dogma.SQUAD_MEMBER, 0, 0))
+        self.assertEqual(fleet.position(b), (dogma.WING_COMMANDER, 0, None))
+        self.assertIs(fleet.booster(), a)
+        self.assertIs(fleet.booster(0, 0), c)
+        self.assertIs(d.fleet, fleet)
+
+        generation = d._generation
+        tree['wings'][0]['squads'][0]['members'] = [d, f]
+        tree['wings'][0]['squads'][1] = {'members': [e]}
+        tree['booster'] = None
+        fleet.apply_tree(tree)
+        self.assertGreater(d._generation, generation)
+        self.assertEqual(fleet.position(d), (dogma.SQUAD_MEMBER, 0, 0))
+        self.assertEqual(fleet.position(e), (dogma.SQUAD_MEMBER, 0, 1))
+        self.assertEqual(fleet.position(f), (dogma.SQUAD_MEMBER, 0, 0))
+        self.assertIsNone(fleet.booster())
+        self.assertEqual(fleet.get_tree()['wings'][0]['squads'][1], {'members': [e]})
+
+        fleet.apply_tree({'commander': a})
+        self.assertEqual(set(fleet.members), set([a]))
+        self.assertIsNone(d.fleet)
+        self.assertIsNone(fleet.booster(0, 0))
+
+        fleet.add_squad_member(1, 0, b)
+        self.assertEqual(fleet.position(b), (dogma.SQUAD_MEMBER, 1, 0))
+        fleet.remove_fleet_member(b)
+        self.assertIsNone(fleet.position(b))
+
+        booster = dogma.Context()
+        fleet.add_squad_member(1, 0, booster)
+        fleet.set_squad_booster(1, 0, booster)
+        booster = None
+        gc.collect()
+        fleet.apply_tree({'commander': a})
+        self.assertEqual(fleet.boosters, {})
+
+        # failing half-way still invalidates the members already moved
+        class Failing(dogma.Context):
+            @property
+            def fleet(self):
+                raise RuntimeError("failing")
+        generation = a._generation
+        with self.assertRaises(RuntimeError):
+            fleet.apply_tree({'commander': b,
+                              'wings': [{'commander': Failing()}]})
+        self.assertGreater(a._generation, generation)
+
+    def test_evaluate_candidates(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE)
+        ctx.add_module(TYPE_125mmGatlingAutoCannonII)
+
+        values, status, new_slot = ctx.evaluate_candidates(
+            slot, [TYPE_SmallAncillaryShieldBooster, TYPE_125mmGatlingAutoCannonII],
+            [(None, ATT_CapacitorNeed), (dogma.Location.ship(), ATT_MaxLockedTargets)],
+            charge=TYPE_CapBooster25)
+        self.assertEqual(new_slot, slot)
+        self.assertEqual(len(values), 4)
+        self.assertEqual(values[0], 0.0)
+        self.assertEqual(values[1], 4.0)
+        self.assertEqual(values[3], 4.0)
+        self.assertEqual(list(status), [dogma.OK] * 4)
+        self.assertEqual(ctx.get_fit()['modules'][0],
+                         (TYPE_StasisWebifierI, dogma.State.ACTIVE, None))
+
+        other = dogma.Context()
+        other.set_ship(TYPE_Rifter)
+        velocity = other.get_ship_attribute(ATT_MaxVelocity)
+        ctx.target(dogma.Location.module(slot), other)
+        webbed = other.get_ship_attribute(ATT_MaxVelocity)
+        self.assertLess(webbed, velocity)
+        values, status, new_slot = ctx.evaluate_candidates(
+            slot, [TYPE_SmallAncillaryShieldBooster],
+            [(dogma.Location.ship(), ATT_MaxLockedTargets)])
+        self.assertIs(ctx.targets_by_location[dogma.Location.module(new_slot)], other)
+        self.assertIn(ctx, other.targeters)
+        self.assertEqual(other.get_ship_attribute(ATT_MaxVelocity), webbed)
+
     def test_gc(self):
         def get_mem_usage():
             line = subprocess.check_output("pmap %d | grep total" % os.getpid(), shell=True)
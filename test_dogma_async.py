@@ -0,0 +1,124 @@
+import threading
+import time
+from unittest import TestCase, skipIf
+
+import dogma
+
+from test_dogma_values import *
+
+try:
+    import asyncio
+    import dogma_async
+except (ImportError, SyntaxError):
+    dogma_async = None
+
+@skipIf(dogma_async is None, "asyncio front-end needs Python 3.5")
+class TestDogmaAsync(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_all(self, *coroutines):
+        return self.loop.run_until_complete(asyncio.gather(*coroutines))
+
+    def test(self):
+        ctx = dogma_async.AsyncContext()
+        other = dogma_async.AsyncContext()
+        self.assertFalse(ctx.linked_with(other))
+
+        fit = {'ship': TYPE_Rifter,
+               'modules': [(TYPE_StasisWebifierI, dogma.State.ACTIVE)]}
+        attributes = [(dogma.Location.ship(), ATT_MaxLockedTargets),
+                      (('module', 0), ATT_CapacitorNeed)]
+        (values, status), slots = self.run_all(
+            ctx.evaluate_fit(fit, attributes),
+            other.load_fit({'ship': TYPE_Scimitar}))
+        self.assertEqual(values[0], 4.0)
+        self.assertEqual(list(status), [dogma.OK, dogma.OK])
+
+        slot = min(ctx.context._modules)
+        self.run_all(ctx.target(dogma.Location.module(slot), other))
+        self.assertTrue(ctx.linked_with(other))
+        capacitors, velocity = self.run_all(
+            ctx.get_capacitor_all(False),
+            other.get_ship_attribute(ATT_MaxVelocity))
+        self.assertEqual(set(capacitors), set([ctx.context, other.context]))
+
+        fleet = dogma_async.AsyncFleet()
+        third = dogma_async.AsyncContext()
+        self.run_all(fleet.add_squad_member(0, 0, third))
+        self.assertTrue(fleet.linked_with(third))
+        self.assertFalse(fleet.linked_with(ctx))
+
+        results, = self.run_all(third.evaluate_fits(
+            [{'ship': TYPE_Rifter}, {'ship': TYPE_Scimitar}],
+            [(dogma.Location.ship(), ATT_MaxLockedTargets)]))
+        self.assertEqual([values[0] for values, status in results], [4.0, 10.0])
+
+    def test_plain_links(self):
+        # linked through Context before being wrapped
+        ctx = dogma.Context()
+        other = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_StasisWebifierI, dogma.State.ACTIVE)
+        ctx.target(dogma.Location.module(slot), other)
+        first = dogma_async.AsyncContext(ctx)
+        second = dogma_async.AsyncContext(other)
+        self.assertTrue(first.linked_with(second))
+
+        running = []
+        most = []
+        def call(context):
+            running.append(context)
+            most.append(len(running))
+            time.sleep(0.02)
+            running.remove(context)
+        self.run_all(first.run(call), second.run(call))
+        self.assertEqual(most, [1, 1])
+
+        ctx.clear_target(dogma.Location.module(slot))
+        self.assertFalse(first.linked_with(second))
+
+    def test_cancel(self):
+        ctx = dogma_async.AsyncContext()
+        release = threading.Event()
+        running = []
+        def call(context):
+            running.append(context)
+            release.wait(5)
+            running.remove(context)
+
+        task = self.loop.create_task(ctx.run(call))
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        # the context stays locked until call has returned
+        second = self.loop.create_task(ctx.run(lambda context: len(running)))
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertFalse(second.done())
+        release.set()
+        self.assertEqual(self.loop.run_until_complete(second), 0)
+
+    def test_cancel_while_waiting(self):
+        wrappers = [dogma_async.AsyncContext(), dogma_async.AsyncContext()]
+        first, second = sorted(wrappers, key=lambda wrapper: id(wrapper.context))
+        release = threading.Event()
+
+        busy = self.loop.create_task(
+            second.run(lambda context: release.wait(5)))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        # holds the lock of first while waiting for the one of second
+        waiting = self.loop.create_task(first.run(lambda context: None, second))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(waiting)
+        self.assertEqual(self.loop.run_until_complete(
+            asyncio.wait_for(first.run(lambda context: 1), 1)), 1)
+        release.set()
+        self.loop.run_until_complete(busy)
@@ -0,0 +1,57 @@
+import math
+import shutil
+import tempfile
+from unittest import TestCase
+
+import dogma
+import dogma_columns
+
+from test_dogma_values import *
+
+class TestDogmaColumns(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test(self):
+        columns = [('locked', dogma.Location.ship(), ATT_MaxLockedTargets),
+                   ('cap_need', ('module', 0), ATT_CapacitorNeed)]
+        writer = dogma_columns.ColumnWriter(self.path, columns, chunk_rows=2)
+        self.assertEqual(writer.attributes, [(loc, att) for name, loc, att in columns])
+
+        ctx = dogma.Context()
+        slots = ctx.load_fit({'ship': TYPE_Rifter,
+                              'modules': [(TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25)]})
+        writer.append_context(1, ctx, slots)
+        reader = dogma_columns.ColumnReader(self.path)
+        self.assertEqual(len(reader), 0)
+
+        writer.append(2, None)
+        self.assertEqual(reader.refresh(), 2)
+        self.assertEqual(reader.row(0), (1, [4.0, 0.0]))
+        self.assertEqual(reader.row(1)[0], 2)
+        self.assertTrue(math.isnan(reader.row(1)[1][0]))
+
+        writer.append(3, [10.0, 1.0])
+        with self.assertRaises(TypeError):
+            writer.append('Rifter fit', [10.0, 1.0])
+        writer.close()
+        self.assertEqual(reader.refresh(), 3)
+        self.assertEqual(reader.columns[1], columns[1])
+
+        with dogma_columns.ColumnWriter(self.path, columns) as writer:
+            writer.append(4, [5.0, 2.0])
+        reader.refresh()
+        self.assertEqual([reader.row(i)[0] for i in range(len(reader))], [1, 2, 3, 4])
+
+        with self.assertRaises(ValueError):
+            dogma_columns.ColumnWriter(self.path, columns[:1])
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        self.assertEqual(list(reader.column('fit_id')), [1, 2, 3, 4])
+        self.assertEqual(list(reader.column('locked', 2)), [10.0, 5.0])
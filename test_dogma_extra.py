@@ -14,6 +14,14 @@ class TestDogmaExtra(TestCase):
 
         ctx.set_ship(TYPE_Rifter)
         affectors_with_ship = ctx.get_affectors(loc)
+        self.assertGreater(len(affectors_with_ship), len(affectors))
+        self.assertEqual(len(affectors_with_ship.memoryview()), len(affectors_with_ship))
+        destid = affectors_with_ship[0].destid
+        self.assertEqual([a.id for a in affectors_with_ship.filter(destid=destid)],
+                         [a.id for a in affectors_with_ship if a.destid == destid])
+        penalized = affectors_with_ship.filter(flags=dogma.AFFECTOR_PENALIZED)
+        unpenalized = affectors_with_ship.filter(without=dogma.AFFECTOR_PENALIZED)
+        self.assertEqual(len(penalized) + len(unpenalized), len(affectors_with_ship))
 
         self.assertTrue(dogma.type_has_effect(TYPE_125mmGatlingAutoCannonII, dogma.State.ONLINE, EFFECT_HiPower))
         self.assertTrue(dogma.type_has_active_effects(TYPE_125mmGatlingAutoCannonII))
@@ -35,3 +43,35 @@ class TestDogmaExtra(TestCase):
         capacitors = ctx.get_capacitor_all(False)
         self.assertEqual(len(capacitors), 1)
         self.assertIn(ctx, capacitors)
+
+        other = dogma.Context()
+        web = ctx.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE)
+        ctx.target(dogma.Location.module(web), other)
+        capacitors = ctx.get_capacitor_all(True)
+        self.assertEqual(set(capacitors), set([ctx, other]))
+        self.assertEqual(capacitors.contexts[capacitors.index[other]], other)
+        self.assertEqual(len(capacitors.memoryview()), 2)
+        self.assertIs(dogma.contexts_by_address[dogma.native_address(other._as_parameter_)], other)
+
+    def test_get_all_effect_attributes(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_125mmGatlingAutoCannonII, charge=TYPE_BarrageS)
+        ctx.add_drone(TYPE_WarriorI, 2)
+        loc = dogma.Location.module(slot)
+
+        attributes = ctx.get_all_effect_attributes()
+        expected = [(location, typeid, effect)
+                    for location, typeid in [(loc, TYPE_125mmGatlingAutoCannonII),
+                                             (dogma.Location.charge(slot), TYPE_BarrageS),
+                                             (dogma.Location.drone(TYPE_WarriorI), TYPE_WarriorI)]
+                    for effect in dogma.type_effects_with_attributes(typeid)]
+        self.assertEqual([(row.location, row.typeid, row.effect) for row in attributes],
+                         expected)
+        self.assertEqual(len(attributes.memoryview()), len(attributes))
+
+        row = attributes[0]
+        self.assertEqual((row.duration, row.tracking, row.discharge, row.range,
+                          row.falloff, row.usage_chance),
+                         ctx.get_location_effect_attributes(loc, row.effect))
+        self.assertEqual(row.falloff, 7500)
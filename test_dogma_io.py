@@ -0,0 +1,80 @@
+from io import StringIO
+from unittest import TestCase
+
+import dogma
+import dogma_io
+
+from test_dogma_values import *
+
+TYPES = {u'Rifter': TYPE_Rifter,
+         u'Scimitar': TYPE_Scimitar,
+         u'Small Ancillary Shield Booster': TYPE_SmallAncillaryShieldBooster,
+         u'Cap Booster 25': TYPE_CapBooster25,
+         u'Stasis Webifier I': TYPE_StasisWebifierI,
+         u'Warrior I': TYPE_WarriorI}
+
+EFT = u"""[Rifter, first]
+Small Ancillary Shield Booster, Cap Booster 25
+Stasis Webifier I /offline
+[Empty High slot]
+
+Warrior I x2
+Warrior I x1
+Unknown Module
+
+Cap Booster 25 x100
+
+[Unknown Ship, skipped]
+Stasis Webifier I
+
+[Scimitar, second]
+"""
+
+class TestDogmaIO(TestCase):
+    def test_parse_eft(self):
+        fits = list(dogma_io.parse_eft(StringIO(EFT), TYPES))
+        self.assertEqual([fit_id for fit_id, fit in fits], [u'first', u'second'])
+        first = fits[0][1]
+        self.assertEqual(first['ship'], TYPE_Rifter)
+        self.assertEqual(first['modules'],
+                         [(TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25),
+                          (TYPE_StasisWebifierI, dogma.State.OFFLINE, None)])
+        self.assertEqual(first['drones'], {})
+        self.assertEqual(fits[1][1]['modules'], [])
+
+        kinds = {TYPE_SmallAncillaryShieldBooster: 'module',
+                 TYPE_StasisWebifierI: 'module',
+                 TYPE_CapBooster25: 'charge',
+                 TYPE_WarriorI: 'drone'}
+        fits = list(dogma_io.parse_eft(StringIO(EFT), TYPES, kinds))
+        self.assertEqual(len(fits[0][1]['modules']), 2)
+        self.assertEqual(fits[0][1]['drones'], {TYPE_WarriorI: 3})
+
+    def test_parse_dna(self):
+        kinds = {TYPE_SmallAncillaryShieldBooster: 'module',
+                 TYPE_CapBooster25: 'charge',
+                 TYPE_WarriorI: 'drone'}
+        dna = u"%d:%d;2:%d;10:%d;3::\nx %d:%d_::\n" % (
+            TYPE_Rifter, TYPE_SmallAncillaryShieldBooster, TYPE_CapBooster25,
+            TYPE_WarriorI, TYPE_Scimitar, TYPE_SmallAncillaryShieldBooster)
+        fits = list(dogma_io.parse_dna(StringIO(dna), kinds,
+                                       charge_fits=lambda module, charge: True))
+        self.assertEqual([fit_id for fit_id, fit in fits], [1, u'x'])
+        self.assertEqual(fits[0][1]['modules'],
+                         [(TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25)] * 2)
+        self.assertEqual(fits[0][1]['drones'], {TYPE_WarriorI: 3})
+        self.assertEqual(fits[1][1]['ship'], TYPE_Scimitar)
+        self.assertEqual(fits[1][1]['modules'],
+                         [(TYPE_SmallAncillaryShieldBooster, dogma.State.OFFLINE, None)])
+
+        with self.assertRaises(ValueError):
+            list(dogma_io.parse_dna(StringIO(u"Rifter::\n"), kinds))
+
+    def test_evaluate_eft(self):
+        attributes = [(dogma.Location.ship(), ATT_MaxLockedTargets),
+                      (('module', 0), ATT_CapacitorNeed)]
+        results = list(dogma_io.evaluate_eft(StringIO(EFT), TYPES, attributes))
+        self.assertEqual([fit_id for fit_id, values, status in results], [u'first', u'second'])
+        self.assertEqual(list(results[0][1]), [4.0, 0.0])
+        self.assertEqual(results[1][1][0], 10.0)
+        self.assertEqual(list(results[1][2]), [dogma.OK, dogma.NOT_FOUND])
@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+import dogma
+import dogma_parallel
+
+from test_dogma_values import *
+
+class TestDogmaParallel(TestCase):
+    def test(self):
+        fits = [{'ship': TYPE_Rifter},
+                {'ship': TYPE_Scimitar},
+                {'ship': TYPE_Rifter,
+                 'modules': [(TYPE_SmallAncillaryShieldBooster, None, TYPE_CapBooster25)]}]
+        attributes = [(dogma.Location.ship(), ATT_MaxLockedTargets),
+                      (('module', 0), ATT_CapacitorNeed)]
+
+        with dogma_parallel.ParallelEvaluator(attributes, processes=2, chunksize=1) as evaluator:
+            results = list(evaluator.evaluate(fits * 3))
+            unordered = sorted(evaluator.evaluate(fits * 3, ordered=False))
+
+        self.assertEqual([index for index, values, status in results], list(range(9)))
+        self.assertEqual(results[0][1][0], 4.0)
+        self.assertEqual(results[1][1][0], 10.0)
+        self.assertEqual(list(results[0][2]), [dogma.OK, dogma.NOT_FOUND])
+        self.assertEqual(results[2][1][1], 0.0)
+        self.assertEqual([list(values) for index, values, status in unordered][:2],
+                         [list(values) for index, values, status in results][:2])
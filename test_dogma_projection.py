@@ -0,0 +1,55 @@
+from ctypes import ArgumentError
+from unittest import TestCase
+
+import dogma
+import dogma_projection
+
+from test_dogma_values import *
+
+class TestDogmaProjection(TestCase):
+    def test(self):
+        web = dogma.Context()
+        web.set_ship(TYPE_Rifter)
+        slot = web.add_module(TYPE_StasisWebifierI, state=dogma.State.ACTIVE)
+        web.add_module(TYPE_125mmGatlingAutoCannonII, state=dogma.State.ACTIVE)
+        guns = dogma.Context()
+        guns.set_ship(TYPE_Rifter)
+        guns.add_module(TYPE_125mmGatlingAutoCannonII, state=dogma.State.ACTIVE)
+        self.assertEqual(dogma_projection.projectable_slots(web), [slot])
+        self.assertEqual(dogma_projection.projectable_slots(guns), [])
+
+        targets = [dogma.Context(), dogma.Context()]
+        targets[0].set_ship(TYPE_Rifter)
+        targets[1].set_ship(TYPE_Scimitar)
+        targets[1].enable_attribute_cache()
+        velocities = [target.get_ship_attribute(ATT_MaxVelocity) for target in targets]
+
+        values, status = dogma_projection.projection_matrix(
+            [web, guns], targets, [(dogma.Location.ship(), ATT_MaxVelocity)])
+        self.assertEqual(len(values), 4)
+        self.assertEqual(list(status), [dogma.OK] * 4)
+        self.assertLess(values[0], velocities[0])
+        self.assertLess(values[1], velocities[1])
+        self.assertEqual(list(values[2:]), velocities)
+
+        self.assertEqual([target.get_ship_attribute(ATT_MaxVelocity) for target in targets],
+                         velocities)
+        self.assertEqual(len(web.targets_by_location), 0)
+
+        web.target(dogma.Location.module(slot), targets[1])
+        dogma_projection.projection_matrix([web], targets[:1], [(dogma.Location.ship(), ATT_MaxVelocity)])
+        self.assertLess(targets[1].get_ship_attribute(ATT_MaxVelocity), velocities[1])
+        self.assertEqual(targets[0].get_ship_attribute(ATT_MaxVelocity), velocities[0])
+
+        # failing half-way, the first target is not left projected on
+        with self.assertRaises(ArgumentError):
+            dogma_projection.projection_matrix(
+                [web], [targets[0], object()],
+                [(dogma.Location.ship(), ATT_MaxVelocity)])
+        self.assertEqual(targets[0].get_ship_attribute(ATT_MaxVelocity), velocities[0])
+        with self.assertRaises(TypeError):
+            dogma_projection.projection_matrix(
+                [web], targets[:1], [(object(), ATT_MaxVelocity)])
+        self.assertEqual(targets[0].get_ship_attribute(ATT_MaxVelocity), velocities[0])
+        self.assertLess(targets[1].get_ship_attribute(ATT_MaxVelocity), velocities[1])
+        self.assertEqual(list(web.targets_by_location.values()), [targets[1]])
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+import dogma
+import dogma_timeline
+
+from test_dogma_values import *
+
+class TestDogmaTimeline(TestCase):
+    def test(self):
+        ctx = dogma.Context()
+        ctx.set_ship(TYPE_Rifter)
+        slot = ctx.add_module(TYPE_125mmGatlingAutoCannonII,
+                              state=dogma.State.ACTIVE, charge=TYPE_BarrageS)
+        ctx.add_module(TYPE_StasisWebifierI)
+        cycles = dogma_timeline.collect(ctx)
+        self.assertEqual(list(cycles.slots), [slot])
+        self.assertEqual(list(cycles.cycles), [200])
+        self.assertGreater(cycles.durations[0], 0)
+        self.assertGreater(cycles.reloads[0], 0)
+        self.assertEqual(list(cycles.amounts), [1.0])
+
+    def test_timeline(self):
+        cycles = dogma_timeline.Cycles()
+        for slot, duration, count, reload_time, amount in [
+                (0, 1000.0, 2, 5000.0, 10.0), (1, 3000.0, 0, 0.0, 1.0)]:
+            cycles.slots.append(slot)
+            cycles.effects.append(0)
+            cycles.durations.append(duration)
+            cycles.cycles.append(count)
+            cycles.reloads.append(reload_time)
+            cycles.amounts.append(amount)
+
+        times = [0, 500, 1000, 1999, 2000, 6999, 7000]
+        values = dogma_timeline.timeline(cycles, times)
+        self.assertEqual(list(values[:7]), [10, 10, 20, 20, 20, 20, 30])
+        self.assertEqual(list(values[7:]), [1, 1, 1, 1, 1, 3, 3])
+        self.assertEqual(list(dogma_timeline.total(cycles, values, times)),
+                         [11, 11, 21, 21, 21, 23, 33])
+
+        values = dogma_timeline.timeline(cycles, times, at_cycle_end=True)
+        self.assertEqual(list(values[:7]), [0, 0, 10, 10, 20, 20, 20])
+        values = dogma_timeline.timeline(cycles, times,
+                                         include_reload_time=False)
+        self.assertEqual(list(values[:7]), [10, 10, 20, 20, 30, 70, 80])
+
+        rates = dogma_timeline.sustained_rates(cycles)
+        self.assertAlmostEqual(rates[0], 10 * 1000.0 / 3500)
+        self.assertAlmostEqual(rates[1], 1000.0 / 3000)
+        rates = dogma_timeline.sustained_rates(cycles, False)
+        self.assertAlmostEqual(rates[0], 10.0)
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import dogma
+import dogma_types
+
+from test_dogma_values import *
+
+class TestDogmaTypes(TestCase):
+    def test(self):
+        typeids = [TYPE_Rifter, TYPE_125mmGatlingAutoCannonII, TYPE_StasisWebifierI]
+        index = dogma_types.TypeIndex.build(typeids, [ATT_LauncherSlotsLeft])
+        self.assertEqual(len(index), 3)
+        self.assertTrue(TYPE_Rifter in index)
+
+        for typeid in typeids:
+            self.assertEqual(index.has_active_effects(typeid),
+                             dogma.type_has_active_effects(typeid))
+            self.assertEqual(index.has_projectable_effects(typeid),
+                             dogma.type_has_projectable_effects(typeid))
+            self.assertEqual(index.effects_with_attributes(typeid),
+                             dogma.type_effects_with_attributes(typeid))
+        self.assertEqual(index.base_attribute(TYPE_Rifter, ATT_LauncherSlotsLeft), 2)
+        self.assertEqual(index.select(dogma_types.PROJECTABLE), [TYPE_StasisWebifierI])
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'types.idx')
+            index.save(path)
+            loaded = dogma_types.TypeIndex.load(path)
+            self.assertEqual(list(loaded.typeids), list(index.typeids))
+            self.assertEqual(list(loaded.flags), list(index.flags))
+            self.assertEqual(loaded.effects_with_attributes(TYPE_125mmGatlingAutoCannonII),
+                             index.effects_with_attributes(TYPE_125mmGatlingAutoCannonII))
+            self.assertEqual(loaded.base_attribute(TYPE_Rifter, ATT_LauncherSlotsLeft), 2)
+            del loaded
+        finally:
+            shutil.rmtree(directory)
+
+        info = dogma.type_has_active_effects.cache_info()
+        dogma.type_has_active_effects(TYPE_Rifter)
+        self.assertEqual(dogma.type_has_active_effects.cache_info().hits, info.hits + 1)
@@ -2,23 +2,31 @@ TYPE_125mmGatlingAutoCannonII = 2873
 TYPE_BarrageS = 12625
 TYPE_CapBooster25 = 263
 TYPE_Drones = 3436
+TYPE_Gunnery = 3300
+TYPE_RapidFiring = 3310
 TYPE_Rifter = 587
 TYPE_Scimitar = 11978
 TYPE_SmallAncillaryShieldBooster = 32774
+TYPE_SmallHybridTurret = 3301
 TYPE_SnakeOmega = 19556
 TYPE_StasisWebifierI = 526
 TYPE_StrongBluePillBooster = 10156
 TYPE_WarriorI = 2486
+TYPE_WeaponUpgrades = 3318
 
 ATT_CapacitorBonus = 67
 ATT_CapacitorNeed = 6
+ATT_CpuLoad = 49
 ATT_DroneBandwidthUsed = 1272
 ATT_Implantness = 331
 ATT_LauncherSlotsLeft = 101
 ATT_MaxActiveDroneBonus = 353
 ATT_MaxActiveDrones = 352
 ATT_MaxLockedTargets = 192
+ATT_MaxVelocity = 37
+ATT_ShieldCapacity = 263
 ATT_SkillLevel = 280
+ATT_Speed = 51
 
 EFFECT_BoosterShieldCapacityPenalty = 2737
 EFFECT_HiPower = 12